@@ -3,11 +3,13 @@ import sys
 import functools
 from itertools import chain
 from pathlib import Path
+from doit import get_var
 # from transforge.util.utils import write_graphs
 from transforge.util.store import TransformationStore
 from quangis.evaluation import read_transformation, variants, \
-    write_csv_summary, upload, query
+    graph_variants, graph_variant, write_csv_summary, upload, query
 from quangis.tools.set import ToolSet, IntegrityError
+from quangis.synthesis.shard import Shard
 
 def mkdir(*paths: Path):
     for path in paths:
@@ -43,6 +45,36 @@ WORKFLOWS = list((DATA / "workflows" / "expert1").glob("*.ttl"))
 CWORKFLOWS = list((DATA / "workflows" / "expert2").glob("*.ttl"))
 VOCAB = BUILD / "cct.ttl"
 
+# Tools from which workflows are synthesized
+GEN_TOOLS = [BUILD / "tools" / "abstract.ttl",
+    BUILD / "tools" / "multi.ttl",
+    DATA / "tools" / "arcgis.ttl"]
+
+# Number of workflows to generate for every question
+QUESTION_SOLUTIONS = int(get_var('solutions', 10))
+
+# Solutions from earlier APE runs are reused when nothing relevant changed
+APE_CACHE = BUILD / "ape" / "cache"
+
+# Time in seconds to divide over a batch of synthesis jobs, most expensive 
+# first; by default, every job just gets its own timeout. The cost of a job is 
+# predicted from the telemetry of earlier runs.
+SYNTHESIS_BUDGET = float(get_var('budget', 0)) or None
+
+# Every run of APE is recorded here; summarize with `python -m 
+# quangis.synthesis.telemetry build/ape/telemetry.jsonl`
+SYNTHESIS_TELEMETRY = BUILD / "ape" / "telemetry.jsonl"
+
+# Transformation graphs are only derived again when the workflow, the tools 
+# or the settings of the graph have changed
+TRANSFORMATION_CACHE = BUILD / "transformations" / "cache"
+
+# To spread synthesis across machines, run `doit shard=i/n ...` on each of 
+# them; the results then go to `build/shards/` until `doit shard_merge` 
+# assembles them into the usual places
+SHARD = Shard.parse(get_var('shard', '0/1'))
+OUT = BUILD if SHARD.count == 1 else BUILD / "shards" / str(SHARD)
+
 # STORE_URL = "https://qanda.soliscom.uu.nl:8000"
 # STORE_URL = "http://uu080967.soliscom.uu.nl:8000"
 
@@ -51,6 +83,10 @@ VOCAB = BUILD / "cct.ttl"
 STORE_URL = "http://localhost:3030/cct"
 STORE_TYPE = "fuseki"
 
+# Graphs that were sent to the store, so that `doit tdb_upload` only needs to 
+# send what changed; remove it after clearing the store
+STORE_MANIFEST = BUILD / "store" / "manifest.json"
+
 
 @functools.cache
 def transformation_store() -> TransformationStore:
@@ -64,13 +100,25 @@ def transformation_store() -> TransformationStore:
         return TransformationStore.backend('fuseki', STORE_URL)
 
 
+def graph_uploader(store: TransformationStore):
+    """Bulk uploads for the store, unless it needs DIGEST authentication, 
+    which only `store.put()` can handle."""
+    from quangis.store import GraphUploader
+    if STORE_TYPE == "marklogic":
+        return None
+    return GraphUploader.for_store(store,
+        connections=int(get_var('connections', 4)))
+
+
 def generated_workflow_names():
     from rdflib.graph import Graph
     from rdflib.namespace import Namespace, RDF
     from rdflib.term import URIRef
+    from collections import Counter
     from quangis.ccd import ccd
     from quangis.polytype import Polytype
     from quangis.namespace import CCD
+    from quangis.synthesis.signature import ToolSignatures
 
     # Find sources and goals from configuration
     confgraph = Graph()
@@ -93,20 +141,71 @@ def generated_workflow_names():
     inputs_outputs = []
     for goal_tuple in goals:
         goal = Polytype.project(ccd.dimensions, goal_tuple)
-        source1 = Polytype(ccd.dimensions, goal)
+        source1 = Polytype(ccd.dimensions, goal.uris())
         source1[CCD.NominalA] = {CCD.NominalA}
         for source_tuple in sources:
             source2 = Polytype.project(ccd.dimensions, source_tuple)
             inputs_outputs.append(([source1, source2], [goal]))
 
+    # Specifications are equivalent if their inputs and outputs stand for the 
+    # same classes, in any order; only the first of those is synthesized
+    types = ToolSignatures({'functions': []})
+    seen = set()
+
     # Finally add names
     for inputs, outputs in inputs_outputs:
+        key = (frozenset(Counter(map(types.extension, inputs)).items()),
+            frozenset(Counter(map(types.extension, outputs)).items()))
+        if key in seen:
+            continue
+        seen.add(key)
         namei = "-".join(sorted(i.canonical_name() for i in inputs))
         nameo = "-".join(sorted(o.canonical_name() for o in outputs))
         name = f"{namei}--{nameo}"
         yield name, inputs, outputs
 
 
+@functools.cache
+def tool_signatures():
+    """The signatures of the tools from which workflows are synthesized. 
+    These can only be derived once the tools have been built."""
+    from quangis.synthesis import WorkflowGenerator
+    return WorkflowGenerator(*GEN_TOOLS, build_dir=BUILD / "ape").signatures
+
+
+def solution_length(inputs, outputs, max_length: int = 10):
+    """The lengths of the workflows to look for, starting from a lower bound 
+    on the length of any solution; or `None` if there can be none."""
+    min_length = tool_signatures().min_length(inputs, outputs, max_length)
+    if min_length is None:
+        return None
+    return min_length, max_length
+
+
+@functools.cache
+def tool_context():
+    """The abstract tools, indexed once for reading any number of workflows 
+    into transformation graphs."""
+    from quangis.evaluation import ToolContext
+    return ToolContext.from_file(BUILD / "tools" / "abstract.ttl")
+
+
+@functools.cache
+def synthesizer():
+    """Use the synthesis server if one is running (see 
+    `quangis.synthesis.server`); otherwise, start APE in this process."""
+    from quangis.synthesis import WorkflowGenerator
+    from quangis.synthesis.cache import SynthesisCache
+    from quangis.synthesis.server import SynthesisClient
+    from quangis.synthesis.telemetry import Telemetry
+    if SynthesisClient.available():
+        print("Using synthesis server", file=sys.stderr)
+        return SynthesisClient(*GEN_TOOLS, build_dir=BUILD / "ape")
+    return WorkflowGenerator(*GEN_TOOLS, build_dir=BUILD / "ape",
+        cache=SynthesisCache(APE_CACHE),
+        telemetry=Telemetry(SYNTHESIS_TELEMETRY))
+
+
 GENERATED_WORKFLOWS_INCL = list(generated_workflow_names())
 GEN_WORKFLOWS = [BUILD / "workflows" / "gen" / f"{wf[0]}.ttl"
     for wf in GENERATED_WORKFLOWS_INCL]
@@ -137,13 +236,10 @@ def task_transformations():
     """Produce all transformation graphs for existing workflows."""
 
     def action(dependencies, targets) -> bool:
-        from rdflib import Graph
         # Quick workaround for https://github.com/pydoit/doit/issues/254
         wf = next(x for x in dependencies if not x.endswith("abstract.ttl"))
         tfm = targets[0]
-        tools = Graph()
-        tools.parse(BUILD / "tools" / "abstract.ttl")
-        read_transformation(wf, tools).serialize(tfm)
+        read_transformation(wf, tool_context()).serialize(tfm)
         return True
 
     dest = BUILD / "transformations"
@@ -175,7 +271,9 @@ def task_tdb_upload_cct():
 
 
 def task_tdb_upload():
-    """Send known transformation graphs to triple store."""
+    """Send known transformation graphs to triple store. Only graphs that 
+    changed since the last upload are sent, and graphs whose file is gone are 
+    removed from the store."""
 
     # No dependencies because we just want to send any transformation graph 
     # that is generated; not force generation first
@@ -184,22 +282,35 @@ def task_tdb_upload():
         from quangis.namespace import RDF, WF
         from rdflib import URIRef
         from transforge.graph import TransformationGraph
+        from quangis.store import StoreManifest, sync
         store = transformation_store()
+        uploader = graph_uploader(store)
 
         files = list((BUILD / "transformations").glob("**/*.ttl"))
 
-        for d in files:
+        def read(d):
             sys.stderr.write(f"Uploading {d}...\n")
-            if not d.exists():
-                continue
             g = TransformationGraph(cct)
             g.parse(d)
             root = g.value(None, RDF.type, WF.Workflow, any=False)
             if root:
                 assert isinstance(root, URIRef)
                 g.uri = root
-                result = store.put(g)
-                sys.stderr.write(f"Uploaded with {str(result)}...\n")
+                return g
+            return None
+
+        if uploader:
+            manifest = StoreManifest(STORE_MANIFEST, STORE_URL)
+            uploaded, unchanged, removed = sync(files, manifest, uploader,
+                read)
+            sys.stderr.write(f"Uploaded {uploaded} graphs; {unchanged} "
+                f"were unchanged and {removed} were removed\n")
+        else:
+            for d in files:
+                g = read(d)
+                if g is not None:
+                    result = store.put(g)
+                    sys.stderr.write(f"Uploaded with {str(result)}...\n")
 
     return dict(
         task_dep=["tdb_upload_cct"],
@@ -245,32 +356,68 @@ def task_viz_pdf():
             targets=[destdir / f"{path.stem}.pdf"],
             actions=[(mkdir, [destdir]), action])
 
+def task_tdb_upload_expert1():
+    """Send expert1 workflows' transformations to the triple store, once for
+    every distinct kind of graph that the evaluation variants need. Every
+    kind goes under its own roots, so that they can be queried side by 
+    side."""
+
+    destdir = BUILD / "eval_tasks" / "graphs"
+
+    def action(variant, kwargsg, targets) -> bool:
+        import json
+        from quangis.evaluation import TransformationCache
+        store = transformation_store()
+        workflows = upload(WORKFLOWS, tool_context(), store,
+            cache=TransformationCache(TRANSFORMATION_CACHE),
+            variant=variant, uploader=graph_uploader(store), **kwargsg)
+        with open(targets[0], 'w') as f:
+            json.dump({str(k): str(v) for k, v in workflows.items()}, f,
+                indent=4)
+        return True
+
+    for variant, kwargsg in graph_variants():
+        yield dict(
+            name=variant,
+            task_dep=["tdb_upload_cct"],
+            file_dep=WORKFLOWS + [BUILD / "tools" / "abstract.ttl"],
+            targets=[destdir / f"{variant}.json"],
+            actions=[(mkdir, [destdir]), (action, [variant, kwargsg])],
+            verbosity=2
+        )
+
 def task_tdb_query_expert1():
     """Evaluate expert1 workflows' transformations against tasks.
-    For this, graphs are sent to the triple store and then queried."""
+    For this, the graphs that were sent to the triple store are queried; the
+    variants do not interfere and can run concurrently (`doit -n`)."""
 
     destdir = BUILD / "eval_tasks"
 
     def action(variant, kwargsg, kwargsq) -> bool:
-        from rdflib import Graph
+        import json
+        from rdflib.term import URIRef
+        manifest = BUILD / "eval_tasks" / "graphs" / \
+            f"{graph_variant(kwargsg)}.json"
+        with open(manifest, 'r') as f:
+            workflows = {URIRef(k): URIRef(v)
+                for k, v in json.load(f).items()}
         store = transformation_store()
-
-        tools = Graph()
-        tools.parse(BUILD / "tools" / "abstract.ttl")
-
-        workflows = upload(WORKFLOWS, tools, store, **kwargsg)
         with open(destdir / f"{variant}.txt", 'w') as f:
-            expect, actual = query(TASKS, store, log=f, **kwargsq)
+            expect, actual, stats = query(TASKS, store, log=f,
+                workflows=workflows,
+                concurrency=int(get_var('concurrency', 4)), **kwargsq)
         with open(destdir / f"{variant}.csv", 'w') as f:
-            write_csv_summary(f, expect, actual, workflows)
+            write_csv_summary(f, expect, actual, set(workflows.values()),
+                stats)
         return True
 
     for variant in variants():
+        name, kwargsg, _ = variant
         yield dict(
-            name=variant[0],
-            task_dep=["tdb_upload_cct"],
-            file_dep=TASKS + WORKFLOWS + [BUILD / "tools" / "abstract.ttl"],
-            targets=[destdir / f"{variant}.csv"],
+            name=name,
+            file_dep=TASKS + [destdir / "graphs" /
+                f"{graph_variant(kwargsg)}.json"],
+            targets=[destdir / f"{name}.csv"],
             actions=[(mkdir, [destdir]), (action, variant)],
             verbosity=2
         )
@@ -342,55 +489,159 @@ def task_wf_expert2():
 def task_wf_gen_raw():
     """Synthesize new abstract workflows using APE."""
 
-    destdir = BUILD / "workflows" / "gen-raw"
+    destdir = OUT / "workflows" / "gen-raw"
     apedir = BUILD / "ape"
 
-    @functools.cache
-    def generator():
-        from quangis.synthesis import WorkflowGenerator
-        gen = WorkflowGenerator(BUILD / "tools" / "abstract.ttl",
-            BUILD / "tools" / "multi.ttl",
-            DATA / "tools" / "arcgis.ttl", build_dir=apedir)
-        return gen
-
     def action(name, target, inputs, outputs) -> bool:
-        from rdflib import Graph
-        from quangis.namespace import WFGEN, bind_all
+        from quangis.namespace import WFGEN
+        from quangis.synthesis.output import write_triples
+
+        # Specifications without solutions need not be given to APE
+        length = solution_length(inputs, outputs)
+        if length is None:
+            print(f"No workflow can satisfy {name}", file=sys.stderr)
+            write_triples(target, ())
+            return True
 
-        gen = generator()
-        solutions_raw = Graph()
-        for wf in gen.run(inputs, outputs, solutions=1, prefix=WFGEN[name]):
-            solutions_raw += wf
-        bind_all(solutions_raw)
-        solutions_raw.serialize(target, format="ttl")
+        gen = synthesizer()
+        write_triples(target, gen.run(inputs, outputs, solutions=1,
+            prefix=WFGEN[name], solution_length=length))
         return True
 
     for name, inputs, outputs in GENERATED_WORKFLOWS_INCL:
-        target = destdir / f"{name}.ttl"
+        if name not in SHARD:
+            continue
+        target = destdir / f"{name}.nt"
         yield dict(
             name=name,
-            file_dep=[BUILD / "tools" / "abstract.ttl",
-                BUILD / "tools" / "multi.ttl",
-                DATA / "tools" / "arcgis.ttl"],
+            file_dep=GEN_TOOLS,
             targets=[target],
             actions=[(mkdir, [destdir, apedir]),
                 (action, [name, target, inputs, outputs])])
 
 
-def task_wf_gen_variants():
-    """Generate input/output specifications to find variant workflows."""
+def task_wf_gen_raw_pool():
+    """Synthesize all missing raw workflows at once, spreading the APE jobs
+    across processes. Use `doit wf_gen_raw_pool processes=N` to set the number
+    of processes and `budget=SECONDS` to bound the time per process."""
 
-    destdir = BUILD / "workflows" / "variants"
+    destdir = OUT / "workflows" / "gen-raw"
     apedir = BUILD / "ape"
 
-    @functools.cache
-    def generator():
+    def action() -> bool:
+        from quangis.namespace import WFGEN
         from quangis.synthesis import WorkflowGenerator
-        gen = WorkflowGenerator(BUILD / "tools" / "abstract.ttl",
-                BUILD / "tools" / "multi.ttl",
-                DATA / "tools" / "arcgis.ttl",
-            build_dir=apedir)
-        return gen
+        from quangis.synthesis.cache import SynthesisCache
+        from quangis.synthesis.job import SynthesisJob
+        from quangis.synthesis.output import TripleWriter, write_triples
+        from quangis.synthesis.pool import SynthesisPool
+        from quangis.synthesis.schedule import SynthesisScheduler
+        from quangis.synthesis.telemetry import Telemetry
+
+        jobs = []
+        for name, inputs, outputs in GENERATED_WORKFLOWS_INCL:
+            target = destdir / f"{name}.nt"
+            if name not in SHARD or target.exists():
+                continue
+            length = solution_length(inputs, outputs)
+            if length is None:
+                print(f"No workflow can satisfy {name}", file=sys.stderr)
+                write_triples(target, ())
+                continue
+            jobs.append(SynthesisJob(name, inputs, outputs,
+                prefix=WFGEN[name], solutions=1, solution_length=length))
+
+        pool = SynthesisPool(
+            functools.partial(WorkflowGenerator, *GEN_TOOLS, build_dir=apedir,
+                cache=SynthesisCache(APE_CACHE),
+                telemetry=Telemetry(SYNTHESIS_TELEMETRY)),
+            processes=int(get_var('processes', 0)) or None)
+        scheduler = SynthesisScheduler(SYNTHESIS_BUDGET,
+            Telemetry(SYNTHESIS_TELEMETRY), signatures=tool_signatures())
+        # Solutions are written as they arrive; only one file is open for 
+        # every job that is running
+        writers: dict[str, TripleWriter] = dict()
+        for job, wf in pool.run(scheduler.plan(jobs, pool.processes)):
+            if job.name not in writers:
+                writers[job.name] = TripleWriter(destdir / f"{job.name}.nt")
+            if wf is not None:
+                writers[job.name].write(wf)
+            elif job.name in pool.failures:
+                writers.pop(job.name).discard()
+            else:
+                writers.pop(job.name).close()
+        return not pool.failures
+
+    return dict(
+        file_dep=GEN_TOOLS,
+        actions=[(mkdir, [destdir, apedir]), action],
+        uptodate=[all((destdir / f"{name}.nt").exists()
+            for name, *_ in GENERATED_WORKFLOWS_INCL if name in SHARD)],
+        verbosity=2)
+
+
+def task_shard_merge():
+    """Assemble the results of synthesis that was split across machines with 
+    `shard=i/n` into the usual build directories. The shards must have been 
+    copied to `build/shards/` first, unless the build directory is shared."""
+
+    def action() -> bool:
+        from quangis.synthesis.shard import merge
+        shards = sorted((BUILD / "shards").glob("*-of-*"))
+        files = merge(shards, BUILD)
+        print(f"Merged {len(files)} files from {len(shards)} shards",
+            file=sys.stderr)
+        return True
+
+    return dict(
+        actions=[action],
+        uptodate=[False],
+        verbosity=2)
+
+
+def task_wf_gen_benchmark():
+    """Compare APE's solving times with and without automatically derived 
+    constraints, on the first few generated specifications. Use `doit 
+    wf_gen_benchmark n=N` to set the number of specifications."""
+
+    dest = BUILD / "eval" / "constraints_benchmark.csv"
+    apedir = BUILD / "ape"
+
+    def action() -> bool:
+        import csv
+        from quangis.synthesis import WorkflowGenerator
+
+        gen = WorkflowGenerator(*GEN_TOOLS, build_dir=apedir)
+        with open(dest, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["specification", "length", "plain_seconds",
+                "plain_solutions", "constrained_seconds",
+                "constrained_solutions"])
+            for name, inputs, outputs in \
+                    GENERATED_WORKFLOWS_INCL[:int(get_var('n', 5))]:
+                length = solution_length(inputs, outputs)
+                if length is None:
+                    continue
+                result = gen.benchmark(inputs, outputs, solution_length=length,
+                    solutions=10)
+                writer.writerow([name, length[1],
+                    *result["plain"], *result["constrained"]])
+                f.flush()
+        return True
+
+    return dict(
+        file_dep=GEN_TOOLS,
+        targets=[dest],
+        actions=[(mkdir, [dest.parent, apedir]), action],
+        uptodate=[False],
+        verbosity=2)
+
+
+def task_wf_gen_variants():
+    """Generate input/output specifications to find variant workflows."""
+
+    destdir = OUT / "workflows" / "variants"
+    apedir = BUILD / "ape"
 
     @functools.cache
     def tool_repo():
@@ -449,7 +700,7 @@ def task_wf_gen_variants():
                 del x[i][CCD.LayerA]
 
         # Generate variants
-        gen = generator()
+        gen = synthesizer()
         solutions_raw = Graph()
         for wf in gen.run(p_source_types, p_target_types, solutions=5, 
                 prefix=WFVAR[shorten(wf.root)]):
@@ -465,6 +716,8 @@ def task_wf_gen_variants():
                 f.write(f"# \t{pt} [projected from {t}]\n")
 
     for wf in WORKFLOWS:
+        if wf.stem not in SHARD:
+            continue
         target = destdir / wf.name
         yield dict(
             name=wf.name,
@@ -504,7 +757,7 @@ def task_wf_gen():
 
     for dest in GEN_WORKFLOWS:
         name = dest.stem
-        src = BUILD / "workflows" / "gen-raw" / f"{name}.ttl"
+        src = BUILD / "workflows" / "gen-raw" / f"{name}.nt"
         yield dict(name=name,
             file_dep=[src],
             targets=[dest],
@@ -622,30 +875,26 @@ def task_wf_gen_question():
     """Generate workflows from queries by translating their CCT types to CCD 
     specifications for APE."""
 
-    dest_impl = BUILD / "query" / "implementations.ttl"
-    destdir = BUILD / "transformations" / "questionbased"
+    destdir = OUT / "transformations" / "questionbased"
     apedir = BUILD / "ape"
 
-    @functools.cache
-    def generator():
-        from quangis.synthesis import WorkflowGenerator
-        gen = WorkflowGenerator(BUILD / "tools" / "abstract.ttl",
-            BUILD / "tools" / "multi.ttl",
-            DATA / "tools" / "arcgis.ttl", build_dir=apedir)
-        return gen
-
-    def tool_repo():
-        return ToolSet.from_file(BUILD / "tools" / "abstract.ttl", 
-            check_integrity=True)
-
-    def action(source) -> None:
-        from rdflib import Graph, RDF, RDFS, URIRef, Literal
-        from quangis.namespace import bind_all, EX, WF, WFGEN
+    def action(source, dest_impl) -> None:
+        import hashlib
+        from collections import defaultdict
+        from rdflib import Graph, RDF, RDFS, URIRef
+        from quangis.namespace import WFGEN
+        from quangis.ccd import ccd
         from quangis.cct2ccd import cct2ccd
-        from quangis.tools.set import InputHackError
+        from quangis.synthesis.cache import SynthesisCache
+        from quangis.synthesis.checkpoint import Checkpoint
+        from quangis.synthesis.job import SynthesisJob
+        from quangis.synthesis.output import TripleWriter
+        from quangis.synthesis.pipeline import SynthesisPipeline
+        from quangis.synthesis.postprocess import load_tools, \
+            question_workflow
+        from quangis.synthesis.schedule import SynthesisScheduler
+        from quangis.synthesis.telemetry import Telemetry
         from transforge.namespace import TF, shorten
-        from transforge.expr import ApplicationError
-        from transforge.graph import WorkflowCompositionError
 
         g = Graph()
         g.parse(source, format="ttl")
@@ -658,12 +907,22 @@ def task_wf_gen_question():
             else:
                 yield node
 
-        repo = tool_repo()
-
-        g_impl = Graph()
+        # Tasks that were finished by an earlier run that was interrupted are 
+        # skipped, as long as the question, tools and settings are the same
+        checkpoint = Checkpoint(dest_impl.with_suffix(".checkpoint.json"),
+            SynthesisCache.key(Path(source).read_text(), QUESTION_SOLUTIONS,
+                [hashlib.sha256(p.read_bytes()).hexdigest()
+                    for p in (ccd.path, *GEN_TOOLS)]))
+        if checkpoint.resumed:
+            print(f"Resuming after {len(checkpoint.jobs)} finished tasks",
+                file=sys.stderr)
+        else:
+            dest_impl.unlink(missing_ok=True)
 
         # Generate workflows
-        gen = generator()
+        gen = synthesizer()
+        tasks = dict()
+        jobs = []
         for task in g.subjects(RDF.type, TF.Task):
             assert isinstance(task, URIRef)
 
@@ -674,17 +933,22 @@ def task_wf_gen_question():
             # here
 
             name = shorten(task)
+            if checkpoint.done(name) or name not in SHARD:
+                continue
             out_node = g.value(task, TF.output)
             out_type = g.value(out_node, TF.type)
             assert isinstance(out_type, URIRef)
 
             in_nodes = set(leaves(out_node))
             in_types = [g.value(n, TF.type) for n in in_nodes]
+            # From the output towards the inputs; reversed, this is the chain 
+            # of types that a workflow should pass through
             intermediate_types = [t
                 for n in g.transitive_objects(out_node, TF['from'])
                 if n not in in_nodes
                 and (t := g.value(n, TF.type))
                 and isinstance(t, URIRef)]
+            intermediate_types.reverse()
 
             out_ccds = [cct2ccd(out_type)]
             in_ccds = [cct2ccd(t) for t in in_types]
@@ -696,60 +960,52 @@ def task_wf_gen_question():
             for ccdt in out_ccds:
                 print('Output:', ccdt, file=sys.stderr)
 
-            for i, wf_raw in enumerate(gen.run(
-                    in_ccds, out_ccds, solutions=100, prefix=WFGEN[name],
-                    constraints=gen.constraint(intermediate_ccds))):
-
-                wf_raw.add((wf_raw.root, TF.implements, task))
-                g_impl.add((task, TF.implementation, wf_raw.root))
-
-                for comment in g.objects(task, RDFS.comment):
-                    wf_raw.add((wf_raw.root, RDFS.comment, comment))
-                wf_raw.add((wf_raw.root, RDFS.comment, Literal(
-                    f"Out: {out_ccds[0]}\nIn: \n"
-                    f"{' & '.join(str(s) for s in in_ccds)}")))
-
-                # Perform input permutation hack
-                assert (None, RDF.type, WF.Workflow) in wf_raw
-
-                invalid = False
-                try:
-                    wf = repo.input_permutation_hack(wf_raw)
-                except InputHackError as e:
-                    # TODO: Note that simply removing workflows that cannot 
-                    # be input-hacked means that we will likely overlook 
-                    # workflows that need e.g. two inputs of the same type
-                    wf = wf_raw
-                    wf.remove((wf_raw.root, RDF.type, WF.Workflow))
-                    wf.add((wf_raw.root, RDF.type, WF.InvalidWorkflow))
-                    wf.add((wf_raw.root, RDFS.comment,
-                        Literal(f"{type(e)}: {e}")))
-                    invalid = True
-                else:
-                    # Derive transformation graphs
-                    try:
-                        wf = read_transformation(wf, repo.graph())
-                    except (WorkflowCompositionError, ApplicationError) as e:
-                        wf.remove((wf_raw.root, RDF.type, WF.Workflow))
-                        wf.add((wf_raw.root, RDF.type, WF.InvalidWorkflow))
-                        wf.add((wf_raw.root, RDFS.comment,
-                            Literal(f"{type(e)}: {e}")))
-                        invalid = True
-                bind_all(wf)
-                wf.serialize(
-                    destdir / f"{'invalid_' if invalid else ''}{name}_{i}.ttl",
-                    format="ttl")
-
-            bind_all(g_impl)
-            g_impl.serialize(dest_impl, format="ttl")
+            tasks[name] = str(task), [str(comment)
+                for comment in g.objects(task, RDFS.comment)]
+            jobs.append(SynthesisJob(name, in_ccds, out_ccds,
+                prefix=WFGEN[name], solutions=QUESTION_SOLUTIONS,
+                guide=intermediate_ccds))
+
+        # While APE works on one task, workers turn the solutions that were 
+        # already found into transformation graphs
+        scheduler = SynthesisScheduler(SYNTHESIS_BUDGET,
+            Telemetry(SYNTHESIS_TELEMETRY),
+            signatures=getattr(gen, 'signatures', None))
+        pipeline = SynthesisPipeline(
+            functools.partial(question_workflow, destdir=destdir,
+                tasks=tasks),
+            processes=int(get_var('processes', 0)) or None,
+            initializer=load_tools,
+            initargs=(BUILD / "tools" / "abstract.ttl",))
+        outputs = defaultdict(list)
+
+        # Links between tasks and their implementations are written as they 
+        # are found
+        with TripleWriter(dest_impl, append=True) as impl:
+            for job, result in pipeline.run(scheduler.run(gen, jobs)):
+                name = job.name
+                if result is None:
+                    if name not in scheduler.failures:
+                        checkpoint.complete(name, len(outputs[name]),
+                            outputs[name])
+                    continue
+                root, path = result
+                impl.add((URIRef(tasks[name][0]), TF.implementation,
+                    URIRef(root)))
+                outputs[name].append(path)
+
+        # A run that was not interrupted starts over the next time
+        checkpoint.remove()
 
     for qb in QUESTIONS:
         src = BUILD / "query" / f"{qb.stem}.ttl"
+        dest_impl = OUT / "query" / f"{qb.stem}.implementations.nt"
         yield dict(
             name=qb.stem,
             file_dep=[src],
             targets=[dest_impl, BUILD / "transformations" / "marker"],
-            actions=[(mkdir, [destdir]), (action, [src])]
+            actions=[(mkdir, [destdir, dest_impl.parent]),
+                (action, [src, dest_impl])]
         )
 
 
@@ -790,11 +1046,7 @@ def task_tdb_query_questions_intersection():
     *both* generated *for* the question and that match the transformation graph 
     *of* the question."""
 
-    src_impl = BUILD / "query" / "implementations.ttl"
-    src_results = BUILD / "query" / "blocklyoutput_retri.results.ttl"
-    dest = BUILD / "query" / "blocklyoutput_retri.intersection.ttl"
-
-    def action(dependencies, targets):
+    def action(src_impl, src_results, targets):
         from rdflib import Graph, BNode
         from rdflib.container import Bag
         from transforge.namespace import TF, RDF
@@ -819,11 +1071,15 @@ def task_tdb_query_questions_intersection():
         g.serialize(targets[0], format="ttl")
 
     for qb in QUESTIONS:
+        src_impl = BUILD / "query" / f"{qb.stem}.implementations.nt"
+        src_results = BUILD / "query" / f"{qb.stem}.results.ttl"
+        dest = BUILD / "query" / f"{qb.stem}.intersection.ttl"
         yield dict(
             name=qb.stem,
             file_dep=[src_results],  # src_impl
             targets=[dest],
-            actions=[(mkdir, [dest.parent]), action],
+            actions=[(mkdir, [dest.parent]),
+                (action, [src_impl, src_results])],
             verbosity=2
         )
 
@@ -6,6 +6,7 @@ from quangis.polytype import Dimension
 class CoreConceptData(Graph):
     def __init__(self, path: Path):
         super().__init__()
+        self.path = path
         self.parse(path, format="ttl")
         self.dimensions = [Dimension(root, self, CCD)
             for root in [CCD.CoreConceptQ, CCD.LayerA, CCD.NominalA]
@@ -4,32 +4,53 @@
 
 from __future__ import annotations
 
+import io
+import os
 import csv
-from datetime import datetime
+import json
+import pickle
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from itertools import product
 from pathlib import Path
 from rdflib.graph import Graph
-from rdflib.term import URIRef
+from rdflib.term import Node, URIRef
 from rdflib.util import guess_format
 
+from transforge.type import Type, TypeVariable, TypingError, Function, \
+    Product, Unit, Top, Bottom
+from transforge.expr import Expr, Source, ApplicationError
+from transforge.lang import Language, ParseError
 from transforge.graph import TransformationGraph
 from transforge.query import TransformationQuery
 from transforge.namespace import TF, shorten
 from transforge.workflow import WorkflowGraph
 from transforge.util.store import TransformationStore
 from quangis.cct import cct
-from quangis.namespace import bind_all
-from typing import Mapping, Iterator, TextIO
+from quangis.namespace import TOOL, bind_all
+from quangis.store import GraphUploader
+from typing import Any, Mapping, Iterator, TextIO
+from typing_extensions import TypedDict
 
 ROOT = Path(__file__).parent.parent
 BUILD_DIR = ROOT / "build"
 
+QueryStats = TypedDict('QueryStats', {
+    'seconds': float,
+    'results': int,
+    'sparql_size': int
+})
+
+
 def write_csv_summary(handle: TextIO,
         actual: Mapping[URIRef, set[URIRef]],
         expect: Mapping[URIRef, set[URIRef]],
-        workflows: set[URIRef]) -> None:
+        workflows: set[URIRef],
+        stats: Mapping[URIRef, QueryStats] | None = None) -> None:
     """Create a summary CSV by providing a mapping from tasks to expected and 
-    actual workflows that match it."""
+    actual workflows that match it. If the `stats` of the queries are given, 
+    they are included for every task."""
 
     tasks = set(expect.keys())
 
@@ -42,8 +63,10 @@ def write_csv_summary(handle: TextIO,
     assert tasks == set(actual.keys())
 
     n_tpos, n_tneg, n_fpos, n_fneg = 0, 0, 0, 0
-    header = ["Task", "Precision", "Recall"] + sorted(
-        shorten(wf) for wf in workflows)
+    header = ["Task", "Precision", "Recall"]
+    if stats is not None:
+        header += ["Seconds", "Results", "SPARQL size"]
+    header += sorted(shorten(wf) for wf in workflows)
     w = csv.DictWriter(handle, fieldnames=header)
     w.writeheader()
     for task in sorted(tasks):
@@ -58,6 +81,10 @@ def write_csv_summary(handle: TextIO,
                 ("⨯" if (wf in actualwfs) ^ (wf in expectwfs) else "")
             for wf in workflows},
             Task=shorten(task))
+        if stats is not None:
+            row["Seconds"] = "{0:.3f}".format(stats[task]['seconds'])
+            row["Results"] = str(stats[task]['results'])
+            row["SPARQL size"] = str(stats[task]['sparql_size'])
         w.writerow(row)
 
     try:
@@ -69,16 +96,284 @@ def write_csv_summary(handle: TextIO,
         w.writerow({"Precision": "?", "Recall": "?"})
 
 
-def read_transformation(wf_path: Path | Graph, tools: Graph,
-        format: str | None = None, **kwargs) -> TransformationGraph:
-    """Read a single workflow into a transformation graph."""
-    wg = WorkflowGraph(cct, tools)
+class InferenceCache(object):
+    """Stands in for a language when transformation graphs are built, and
+    remembers the outcome of type inference for every tool application, so
+    that the same expression applied to inputs of the same types is only
+    inferred once. Any later application is a copy of the inferred
+    expression fragment, with the new inputs put in place of the old.
+
+    The outcome of inference can only be reused if it depends on nothing but
+    the text of the inputs' types. This holds for inputs whose type is
+    fully known and for fresh sources that nothing is known about yet; any
+    other application is inferred as usual."""
+
+    def __init__(self, language: Language = cct):
+        self.language = language
+        self.outcomes: dict[tuple, bytes | Exception] = dict()
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+        # Operators are shared between all expressions; they are referred to
+        # rather than copied along with the fragments
+        self.shared: list[Any] = [*language.types.values(),
+            *language.operators.values(), Function, Product, Unit, Top,
+            Bottom]
+        self._shared_index = {id(x): i for i, x in enumerate(self.shared)}
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.language, attr)
+
+    @staticmethod
+    def fresh(expr: Expr) -> bool:
+        """Is this a source whose type is still entirely unknown?"""
+        t = expr.type
+        return (isinstance(expr, Source) and isinstance(t, TypeVariable)
+            and t.unification is None and t.lower is None
+            and t.upper is None and t.variables() == {t})
+
+    def key(self, string: str, *args: Expr) \
+            -> tuple[str, tuple[str | None, ...], tuple[int, ...]] | None:
+        """The expression and the types of its inputs, or `None` if the
+        outcome of inference depends on more than that. Inputs that occur
+        more than once are noted, since a fresh source that is passed twice
+        is not the same as two fresh sources."""
+        types: list[str | None] = []
+        for arg in args:
+            if self.fresh(arg):
+                types.append(None)
+            elif arg.type.variables():
+                return None
+            else:
+                types.append(str(arg.type))
+        occurrences = [next(i for i, a in enumerate(args) if a is arg)
+            for arg in args]
+        return string, tuple(types), tuple(occurrences)
+
+    def parse(self, string: str, *args: Expr) -> Expr:
+        key = self.key(string, *args)
+        if key is None:
+            self.uncached += 1
+            return self.language.parse(string, *args)
+
+        try:
+            outcome = self.outcomes[key]
+        except KeyError:
+            self.misses += 1
+            try:
+                expr = self.language.parse(string, *args)
+            except (TypingError, ParseError, ApplicationError) as e:
+                self.outcomes[key] = e
+                raise
+            # Fresh sources have since been given a type, which is stored
+            # alongside the fragment
+            fresh = {i: arg.type for i, arg in enumerate(args)
+                if key[1][i] is None}
+            self.outcomes[key] = self._dump((expr, fresh), args)
+            return expr
+
+        self.hits += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        # The types of fresh sources are unified rather than replaced, since 
+        # their variables may already be referred to elsewhere
+        expr, fresh = self._load(outcome, args)
+        for i, t in fresh.items():
+            args[i].type.unify(t)
+        return expr
+
+    def _dump(self, obj: Any, args: tuple[Expr, ...]) -> bytes:
+        """Serialize an expression fragment with references in place of the
+        shared operators and the inputs. This is much faster to copy than
+        the fragment itself."""
+        inputs = {id(arg): i for i, arg in enumerate(args)}
+        shared = self._shared_index
+
+        class Pickler(pickle.Pickler):
+            def persistent_id(self, x: Any) -> tuple[str, int] | None:
+                if id(x) in shared:
+                    return "shared", shared[id(x)]
+                if id(x) in inputs:
+                    return "input", inputs[id(x)]
+                return None
+
+        buffer = io.BytesIO()
+        Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+        return buffer.getvalue()
+
+    def _load(self, data: bytes, args: tuple[Expr, ...]) -> Any:
+        shared = self.shared
+
+        class Unpickler(pickle.Unpickler):
+            def persistent_load(self, pid: tuple[str, int]) -> Any:
+                kind, i = pid
+                return shared[i] if kind == "shared" else args[i]
+
+        return Unpickler(io.BytesIO(data)).load()
+
+    def report(self) -> str:
+        total = self.hits + self.misses + self.uncached
+        rate = self.hits / total if total else 0.0
+        return (f"Type inference cache: {self.hits} hits, {self.misses} "
+            f"misses, {self.uncached} uncached ({rate:.1%} hit rate)")
+
+
+class ToolContext(object):
+    """The tools that workflows refer to, indexed once so that any number of 
+    workflows can be read against them without building or searching the 
+    tool graph again."""
+
+    def __init__(self, tools: Graph, language: Language = cct):
+        self.graph = tools
+        self.language = language
+        self.expressions: dict[URIRef, str] = {tool: str(expr)
+            for tool, expr in tools.subject_objects(
+                language.namespace.expression)
+            if isinstance(tool, URIRef)}
+        self._parsed: dict[URIRef, tuple[Expr, list[Source]]] = dict()
+        self.inference = InferenceCache(language)
+
+    @staticmethod
+    def from_file(*paths: Path, language: Language = cct) -> ToolContext:
+        tools = Graph()
+        for path in paths:
+            tools.parse(path, format=guess_format(str(path)))
+        return ToolContext(tools, language)
+
+    @property
+    def digest(self) -> str:
+        """A hash of the expressions of all tools, which is all that
+        transformation graphs depend on."""
+        data = json.dumps(sorted((str(tool), expr)
+            for tool, expr in self.expressions.items()))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def parsed(self, tool: URIRef) -> tuple[Expr, list[Source]]:
+        """The expression of a tool, parsed only once, along with the sources 
+        that stand for its inputs. There is a source for every input that the 
+        tool declares."""
+        try:
+            return self._parsed[tool]
+        except KeyError:
+            sources = [Source()
+                for _ in set(self.graph.objects(tool, TOOL.input))]
+            expr = self.language.parse(self.expressions[tool], *sources)
+            self._parsed[tool] = expr, sources
+            return expr, sources
+
+    def signature(self, tool: URIRef) -> tuple[list[Type], Type]:
+        """The types of the inputs and of the output of a tool, as inferred 
+        from its expression."""
+        expr, sources = self.parsed(tool)
+        return [s.type.normalize() for s in sources], expr.type.normalize()
+
+    def workflow(self) -> ContextWorkflowGraph:
+        return ContextWorkflowGraph(self)
+
+
+class ContextWorkflowGraph(WorkflowGraph):
+    """A workflow graph that looks up the expressions of its tools in a 
+    `ToolContext`."""
+
+    def __init__(self, context: ToolContext):
+        super().__init__(context.language, context.graph)
+        self.context = context
+
+    def expression(self, tool_or_resource: Node) -> str:
+        if tool_or_resource in self.tool_outputs:
+            tool = self.tool(tool_or_resource)
+        else:
+            assert isinstance(tool_or_resource, URIRef)
+            tool = tool_or_resource
+        try:
+            return self.context.expressions[tool]
+        except KeyError:
+            raise ValueError(
+                f"{tool} has no algebra expression in the "
+                f"{self.language.namespace} namespace")
+
+
+class TransformationCache(object):
+    """A directory of transformation graphs, stored as N-Triples and
+    addressed by a hash of the workflow file, the tools and the settings of
+    the graph. The root of the workflow is kept in a comment on the first
+    line."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(wf_path: Path, tools: ToolContext, **kwargs) -> str:
+        with open(wf_path, 'rb') as f:
+            workflow = hashlib.sha256(f.read()).hexdigest()
+        data = json.dumps([workflow, tools.digest, kwargs], sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.nt"
+
+    def get(self, key: str, **kwargs) -> TransformationGraph | None:
+        try:
+            with open(self.path(key), 'rb') as f:
+                header = f.readline().decode("utf-8")
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        g = TransformationGraph(cct, **kwargs)
+        g.parse(data=data, format="nt")
+        uri = header.removeprefix("#").strip()
+        g.uri = URIRef(uri) if uri else None
+        bind_all(g)
+        return g
+
+    def put(self, key: str, g: TransformationGraph) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            f.write(f"# {g.uri or ''}\n".encode("utf-8"))
+            f.write(g.serialize(format="nt", encoding="utf-8"))
+        os.replace(tmp, path)
+
+    def report(self) -> str:
+        return (f"Transformation graph cache: {self.hits} hits, "
+            f"{self.misses} misses")
+
+
+def read_transformation(wf_path: Path | Graph, tools: Graph | ToolContext,
+        format: str | None = None, cache: TransformationCache | None = None,
+        **kwargs) -> TransformationGraph:
+    """Read a single workflow into a transformation graph. When reading many 
+    workflows, pass the tools as a `ToolContext`. Graphs of workflow files
+    are taken from the `cache` if it has them."""
+    if cache and not isinstance(wf_path, Graph):
+        if not isinstance(tools, ToolContext):
+            tools = ToolContext(tools)
+        key = cache.key(wf_path, tools, **kwargs)
+        g = cache.get(key, **kwargs)
+        if g is None:
+            g = read_transformation(wf_path, tools, format, **kwargs)
+            cache.put(key, g)
+        return g
+
+    language: Language | InferenceCache
+    if isinstance(tools, ToolContext):
+        wg: WorkflowGraph = tools.workflow()
+        language = tools.inference
+    else:
+        wg = WorkflowGraph(cct, tools)
+        language = cct
     if isinstance(wf_path, Graph):
         wg += wf_path
     else:
         wg.parse(wf_path, format=format or guess_format(str(wf_path)))
 
-    g = TransformationGraph(cct, **kwargs)
+    g = TransformationGraph(language, **kwargs)  # type: ignore
     try:
         wg.refresh()
     except ValueError:
@@ -127,40 +422,119 @@ def variants() -> Iterator[tuple[str, dict, dict]]:
         yield name, kwargsg, kwargsq
 
 
-def upload(workflow_paths: list[Path], tools: Graph,
-        store: TransformationStore, **kwargs) -> set[URIRef]:
-    workflows = set()
-    for wf_path in workflow_paths:
-        g = read_transformation(wf_path, tools, **kwargs)
-        assert g.uri
-        workflows.add(g.uri)
-        store.put(g)
+def graph_variant(kwargsg: Mapping[str, bool]) -> str:
+    """A name for the settings of a transformation graph. Different variants
+    of the experiment may share the same graphs."""
+    return "-".join((
+        "pass" if kwargsg.get('passthrough', True) else "block",
+        "internal" if kwargsg.get('with_intermediate_types') else "opaque"))
+
+
+def graph_variants() -> Iterator[tuple[str, dict]]:
+    """The distinct settings of transformation graphs that the variants of
+    the experiment need."""
+    seen = set()
+    for _, kwargsg, _ in variants():
+        name = graph_variant(kwargsg)
+        if name not in seen:
+            seen.add(name)
+            yield name, kwargsg
+
+
+def variant_root(root: URIRef, variant: str) -> URIRef:
+    return URIRef(f"{root}/{variant}")
+
+
+def rename(g: TransformationGraph, uri: URIRef) -> TransformationGraph:
+    """Give a transformation graph another root, so that graphs for the same
+    workflow can live side by side in a store."""
+    assert g.uri
+    renamed = TransformationGraph(cct)
+    for s, p, o in g:
+        renamed.add((uri if s == g.uri else s, p, uri if o == g.uri else o))
+    renamed.uri = uri
+    bind_all(renamed)
+    return renamed
+
+
+def upload(workflow_paths: list[Path], tools: Graph | ToolContext,
+        store: TransformationStore, cache: TransformationCache | None = None,
+        variant: str | None = None, uploader: GraphUploader | None = None,
+        **kwargs) -> dict[URIRef, URIRef]:
+    """Send the transformation graphs of workflows to a store. If a
+    `variant` is given, every graph goes under a root of its own (see
+    `variant_root()`), so that several variants can be in the store at once.
+    With an `uploader`, graphs are sent in bulk rather than one by one.
+    Return a mapping from the roots in the store to the workflows."""
+    if not isinstance(tools, ToolContext):
+        tools = ToolContext(tools)
+    workflows: dict[URIRef, URIRef] = dict()
+
+    def graphs() -> Iterator[TransformationGraph]:
+        for wf_path in workflow_paths:
+            g = read_transformation(wf_path, tools, cache=cache, **kwargs)
+            wf = g.uri
+            assert wf
+            if variant:
+                g = rename(g, variant_root(wf, variant))
+            assert g.uri
+            workflows[g.uri] = wf
+            yield g
+
+    if uploader:
+        uploader.upload(graphs())
+    else:
+        for g in graphs():
+            store.put(g)
+    print(tools.inference.report())
+    if cache:
+        print(cache.report())
     return workflows
 
 
 def query(task_paths: list[Path], store: TransformationStore,
-          log: TextIO | None = None, **kwargs) \
-        -> tuple[dict[URIRef, set[URIRef]], dict[URIRef, set[URIRef]]]:
+          log: TextIO | None = None,
+          workflows: Mapping[URIRef, URIRef] | None = None,
+          concurrency: int = 4, **kwargs) \
+        -> tuple[dict[URIRef, set[URIRef]], dict[URIRef, set[URIRef]],
+            dict[URIRef, QueryStats]]:
+    """Find the workflows that match each task, with at most `concurrency`
+    queries underway at a time. If `workflows` maps roots in the store to
+    workflows (see `upload()`), only those roots are considered. Return the
+    actual and expected workflows for every task, and how long its query
+    took, how many results it had and the size of the SPARQL."""
     actual: dict[URIRef, set[URIRef]] = dict()
     expect: dict[URIRef, set[URIRef]] = dict()
-    for task_path in task_paths:
-        query = read_query(task_path, **kwargs)
-        root = query.root
-        assert isinstance(root, URIRef)
-        t1 = datetime.now()
-        print(f"Querying: \t{root.n3()}")
-
-        actual[root] = store.run(query)  # type: ignore
-        expect[root] = set(
-            query.graph.objects(root, TF.implementation))  # type: ignore
-        t2 = datetime.now()
-
-        if log:
-            log.write(f"\n\nTask: {task_path}\n")
-            log.write(query.sparql())
-            log.write(
-                f"\nWorkflows: {', '.join(wf.n3() for wf in actual[root])}")
-
-        print(f"Results: \t{', '.join(wf.n3() for wf in actual[root])}")
-        print(f"Time: \t\t{t2 - t1}")
-    return actual, expect
+    stats: dict[URIRef, QueryStats] = dict()
+    queries = [read_query(task_path, **kwargs) for task_path in task_paths]
+
+    def run(query: TransformationQuery) -> tuple[set, float]:
+        t1 = time.perf_counter()
+        results = store.run(query)
+        return results, time.perf_counter() - t1
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = [executor.submit(run, q) for q in queries]
+        for task_path, query, future in zip(task_paths, queries, futures):
+            root = query.root
+            assert isinstance(root, URIRef)
+            results, seconds = future.result()
+            if workflows is not None:
+                results = {workflows[r] for r in results if r in workflows}
+            actual[root] = results
+            expect[root] = set(
+                query.graph.objects(root, TF.implementation))  # type: ignore
+            sparql = query.sparql()
+            stats[root] = QueryStats(seconds=seconds, results=len(results),
+                sparql_size=len(sparql))
+
+            found = ', '.join(wf.n3() for wf in actual[root])
+            if log:
+                log.write(f"\n\nTask: {task_path}\n")
+                log.write(sparql)
+                log.write(f"\nWorkflows: {found}")
+
+            print(f"Queried: \t{root.n3()}")
+            print(f"Results: \t{found}")
+            print(f"Time: \t\t{seconds:.3f}s")
+    return actual, expect, stats
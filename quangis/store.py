@@ -0,0 +1,257 @@
+"""
+Sending many transformation graphs to a triple store at once. Uploading
+graphs one by one spends most of its time waiting for round trips; here,
+graphs are sent in batches, over a few connections that are kept open. A
+manifest of what was sent makes it possible to only send what changed.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import threading
+import http.client
+from pathlib import Path
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, Future, wait, \
+    FIRST_COMPLETED
+from typing import Any, Callable, Iterable, Iterator
+from rdflib import Graph
+from rdflib.term import URIRef
+from transforge.util.store import TransformationStore
+
+
+class UploadError(Exception):
+    pass
+
+
+class GraphUploader(object):
+    """Replaces named graphs in a store through its SPARQL update endpoint.
+    Every batch of `batch_size` graphs is a single request, which drops the
+    old graphs and inserts the new ones as N-Triples. At most `connections`
+    requests are underway at any time, each on a connection of its own; a
+    request that fails is retried `retries` times, waiting longer every
+    time.
+
+    Only stores without authentication or with basic authentication are
+    supported; for others, use `TransformationStore.put()`."""
+
+    def __init__(self, url_update: str,
+            cred: tuple[str, str] | None = None,
+            connections: int = 4,
+            batch_size: int = 50,
+            retries: int = 3,
+            backoff: float = 1.0):
+        url = urlparse(url_update)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Cannot upload to {url_update}")
+        self.url = url
+        self.connections = connections
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = {"Content-Type": "application/sparql-update"}
+        if cred:
+            token = base64.b64encode(":".join(cred).encode("utf-8"))
+            self.headers["Authorization"] = f"Basic {token.decode('ascii')}"
+        self._local = threading.local()
+        self._opened: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def for_store(store: TransformationStore, **kwargs) -> GraphUploader:
+        """Find the update endpoint that belongs to a store. For Fuseki,
+        that is `/update` rather than `/query`; MarkLogic takes updates at
+        the same endpoint as queries."""
+        url = store.url_sparql
+        if url.endswith("/query"):
+            url = url[:-len("/query")] + "/update"
+        return GraphUploader(url, **kwargs)
+
+    @staticmethod
+    def request(graphs: Iterable[Graph]) -> bytes:
+        """Write an update that replaces the given graphs, each of which
+        must have a `uri`."""
+        parts = []
+        for g in graphs:
+            uri = getattr(g, 'uri', None) or g.identifier
+            assert isinstance(uri, URIRef)
+            data = g.serialize(format="nt", encoding="utf-8")
+            parts.append(f"DROP SILENT GRAPH {uri.n3()};\n"
+                f"INSERT DATA {{ GRAPH {uri.n3()} {{\n".encode("utf-8"))
+            parts.append(data)
+            parts.append(b"} };\n")
+        return b"".join(parts)
+
+    @staticmethod
+    def request_delete(uris: Iterable[URIRef]) -> bytes:
+        return "".join(f"DROP SILENT GRAPH {uri.n3()};\n"
+            for uri in uris).encode("utf-8")
+
+    def connection(self) -> http.client.HTTPConnection:
+        """The connection of the current thread, which is kept open."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = http.client.HTTPSConnection \
+                if self.url.scheme == "https" else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.url.netloc, timeout=300)
+            with self._lock:
+                self._opened.append(conn)
+        return conn
+
+    def reset(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def send(self, graphs: list[Graph]) -> int:
+        """Send one batch of graphs and return the number of graphs."""
+        self.post(self.request(graphs))
+        return len(graphs)
+
+    def post(self, body: bytes) -> None:
+        path = self.url.path or "/"
+        error = ""
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self.connection()
+                conn.request("POST", path, body=body, headers=self.headers)
+                response = conn.getresponse()
+                message = response.read()
+                if response.status < 300:
+                    return
+                error = f"{response.status} {response.reason}: " \
+                    f"{message[:200]!r}"
+                if response.status < 500:
+                    raise UploadError(error)
+            except (OSError, http.client.HTTPException) as e:
+                error = str(e)
+                self.reset()
+            if attempt < self.retries:
+                delay = self.backoff * 2 ** attempt
+                print(f"Upload failed ({error}); retrying in {delay}s",
+                    file=sys.stderr)
+                time.sleep(delay)
+        raise UploadError(f"Upload failed after {self.retries + 1} "
+            f"attempts: {error}")
+
+    def delete(self, uris: Iterable[URIRef]) -> int:
+        """Remove graphs from the store and return how many there were."""
+        count = 0
+        for batch in self.batches(uris):
+            self.post(self.request_delete(batch))
+            count += len(batch)
+        return count
+
+    def batches(self, graphs: Iterable[Any]) -> Iterator[list[Any]]:
+        batch: list[Any] = []
+        for g in graphs:
+            batch.append(g)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def upload(self, graphs: Iterable[Graph]) -> int:
+        """Upload graphs as they come and return how many were uploaded.
+        Batches are serialized in the threads that send them, so that
+        serializing one batch overlaps with waiting for others."""
+        count = 0
+        pending: set[Future] = set()
+        try:
+            with ThreadPoolExecutor(self.connections) as executor:
+                for batch in self.batches(graphs):
+                    pending.add(executor.submit(self.send, batch))
+                    if len(pending) >= self.connections:
+                        done, pending = wait(pending,
+                            return_when=FIRST_COMPLETED)
+                        count += sum(f.result() for f in done)
+                count += sum(f.result() for f in pending)
+        finally:
+            with self._lock:
+                for conn in self._opened:
+                    conn.close()
+                self._opened.clear()
+        return count
+
+
+class StoreManifest(object):
+    """A record of the graph files that were sent to a store, with the root
+    of the graph in each file and a hash of its content. The manifest
+    belongs to a `key` that identifies the store; if the key has changed,
+    nothing is assumed to be in the store. Remove the manifest to upload
+    everything again, for example after the store was cleared."""
+
+    def __init__(self, path: Path, key: str):
+        self.path = path
+        self.key = key
+        self.files: dict[str, dict[str, str]] = dict()
+        try:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if manifest.get('key') == key:
+            self.files = manifest['files']
+
+    @staticmethod
+    def digest(path: Path) -> str:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(dict(key=self.key, files=self.files), f, indent=4)
+        os.replace(tmp, self.path)
+
+
+def sync(paths: Iterable[Path], manifest: StoreManifest,
+        uploader: GraphUploader,
+        read: Callable[[Path], Graph | None]) -> tuple[int, int, int]:
+    """Bring the store up to date with a collection of graph files. Only
+    files that are new or changed since the last sync are read (with
+    `read`, which returns a graph with a `uri`, or `None` to skip the
+    file) and uploaded. Skipped files are recorded without a root, so that
+    they are not read again until they change. The graphs of files that
+    are gone are removed. Return the number of graphs uploaded, of files
+    unchanged and of graphs removed."""
+
+    old = manifest.files
+    new: dict[str, dict[str, str]] = dict()
+    changed: list[tuple[str, str]] = []
+    for path in paths:
+        digest = StoreManifest.digest(path)
+        entry = old.get(str(path))
+        if entry and entry['hash'] == digest:
+            new[str(path)] = entry
+        else:
+            changed.append((str(path), digest))
+
+    def graphs() -> Iterator[Graph]:
+        for path, digest in changed:
+            g = read(Path(path))
+            if g is None:
+                new[path] = dict(uri="", hash=digest)
+                continue
+            new[path] = dict(uri=str(g.uri), hash=digest)  # type: ignore
+            yield g
+
+    uploaded = uploader.upload(graphs())
+
+    # Remove graphs that no file provides anymore
+    current = set(entry['uri'] for entry in new.values() if entry['uri'])
+    gone = set(entry['uri'] for entry in old.values() if entry['uri']) \
+        - current
+    removed = uploader.delete(URIRef(uri) for uri in sorted(gone))
+
+    manifest.files = new
+    manifest.save()
+    return uploaded, len(new) - len(changed), removed
@@ -7,9 +7,11 @@ from __future__ import annotations
 
 import sys
 import json
+import time
+import hashlib
 from pathlib import Path
 import typing
-from typing import Iterable, Iterator
+from typing import Iterable, Iterator, Any
 from typing_extensions import TypedDict
 import urllib.request
 
@@ -22,32 +24,90 @@ from rdflib.namespace import Namespace, RDF, RDFS
 from transforge.namespace import EX, shorten
 
 from quangis.polytype import Polytype
+from quangis.synthesis.job import polytype2json
+from quangis.synthesis.cache import SynthesisCache
+from quangis.synthesis.constraint import Constraint
+from quangis.synthesis.telemetry import Telemetry, run_id
 
-# def start_ape(version="2.1.5") -> None:
-def start_ape(version="1.1.12") -> None:
-    name = f"APE-{version}-executable.jar"
+# APE_VERSION = "2.1.5"
+APE_VERSION = "1.1.12"
+
+# Java packages; these are only imported once the JVM has been started by
+# `start_ape()`, which happens upon constructing the first `APE` object
+j_io: Any = None
+j_util: Any = None
+j_json: Any = None
+j_ape: Any = None
+_jvm_args: list[str] = []
+
+
+def sha1sum(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    # Ensure that the APE JAR is available
+
+def ape_jar(version: str = APE_VERSION) -> Path:
+    """Find the APE JAR in the cache directory, downloading it if it is absent 
+    or if it does not match the checksum that was published alongside it. 
+    Once the JAR and its checksum are in the cache, no network access is 
+    needed to verify it."""
+
+    name = f"APE-{version}-executable.jar"
     repo = "https://repo1.maven.org/maven2"
     url = f"{repo}/io/github/sanctuuary/APE/{version}/{name}"
     cache_dir = Path(user_cache_dir("quangis", "quangis"))
     path = cache_dir / name
-    if not path.exists():
-        print(f"{path} not found; now downloading from {url}", file=sys.stderr)
-        cache_dir.mkdir(exist_ok=True, parents=True)
-        urllib.request.urlretrieve(url, filename=path)
+    path_sha1 = cache_dir / f"{name}.sha1"
 
-    # Start it
-    jpype.startJVM(classpath=[str(path)])
-
-
-start_ape()
-
-# Java imports
-import java.io as j_io  # noqa: E402
-import java.util as j_util  # noqa: E402
-import org.json as j_json  # noqa: E402
-import nl.uu.cs.ape.sat as j_ape  # noqa: E402
+    if path.exists() and not path_sha1.exists():
+        try:
+            urllib.request.urlretrieve(f"{url}.sha1", filename=path_sha1)
+        except OSError:
+            print(f"Warning: no checksum for {path} and none could be "
+                f"downloaded; using it unverified", file=sys.stderr)
+            return path
+
+    if path.exists():
+        expected = path_sha1.read_text().split()[0].strip()
+        if sha1sum(path) == expected:
+            return path
+        print(f"{path} does not match its checksum", file=sys.stderr)
+
+    print(f"{path} not found; now downloading from {url}", file=sys.stderr)
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    urllib.request.urlretrieve(f"{url}.sha1", filename=path_sha1)
+    urllib.request.urlretrieve(url, filename=path)
+    expected = path_sha1.read_text().split()[0].strip()
+    if sha1sum(path) != expected:
+        path.unlink()
+        raise RuntimeError(f"Downloaded {url} does not match its checksum")
+    return path
+
+
+def start_ape(version: str = APE_VERSION,
+        jvm_args: Iterable[str] = ()) -> None:
+    """Start the JVM with APE on its classpath and import the Java packages we 
+    need. JPype allows only one JVM per process, so if it is already running, 
+    the given options cannot take effect anymore."""
+
+    global j_io, j_util, j_json, j_ape, _jvm_args
+
+    jvm_args = list(jvm_args)
+    if jpype.isJVMStarted():
+        if jvm_args and jvm_args != _jvm_args:
+            print(f"Warning: JVM already started; ignoring options "
+                f"{jvm_args}", file=sys.stderr)
+    else:
+        jpype.startJVM(*jvm_args, classpath=[str(ape_jar(version))])
+        _jvm_args = jvm_args
+
+    import java.io as j_io  # noqa: E402
+    import java.util as j_util  # noqa: E402
+    import org.json as j_json  # noqa: E402
+    import nl.uu.cs.ape.sat as j_ape  # noqa: E402
 
 
 ToolDict = TypedDict('ToolDict', {
@@ -73,7 +133,15 @@ class APE(object):
     def __init__(self, taxonomy: Path | Graph, tools: Path | ToolsDict,
             ontology_prefix_iri: str, tool_root: Node, dimensions: list[Node],
             build_dir: Path = Path("."),
-            strictToolAnnotations: bool = True):
+            strictToolAnnotations: bool = True,
+            jvm_args: Iterable[str] = (),
+            cache: SynthesisCache | None = None,
+            telemetry: Telemetry | None = None):
+        """The JVM is started and APE's domain setup is loaded only when they 
+        are first needed; `jvm_args` such as `-Xmx8g` are passed to the JVM at 
+        that point. If a `cache` is given, synthesis results are reused for 
+        identical runs. If `telemetry` is given, a record of every run is 
+        written to it."""
 
         # Serialize if we weren't given paths
         if isinstance(taxonomy, Graph):
@@ -89,48 +157,86 @@ class APE(object):
         else:
             tools_file = tools
 
-        # Set up APE in JVM
-        self.config = j_ape.configuration.APECoreConfig(
-            j_io.File(str(taxonomy_file)),  # ontology
-            str(ontology_prefix_iri),  # ontologyPrefixIRI
-            str(tool_root),  # toolTaxonomyRoot
-            j_util.Arrays.asList(*map(str, dimensions)),  # dataDimensionsRoots
-            j_io.File(str(tools_file)),  # toolAnnotations
-            strictToolAnnotations  # strictToolAnnotations
-        )
-        self.ape = j_ape.APE(self.config)
-        self.setup = self.ape.getDomainSetup()
+        self.taxonomy_file = taxonomy_file
+        self.tools_file = tools_file
+        self.ontology_prefix_iri = str(ontology_prefix_iri)
+        self.tool_root = str(tool_root)
+        self.dimensions = [str(d) for d in dimensions]
+        self.strictToolAnnotations = strictToolAnnotations
+        self.jvm_args = list(jvm_args)
+        self.cache = cache
+        self.telemetry = telemetry
+
+        # Identifies the domain that APE works with, for caching purposes
+        self.digest = SynthesisCache.key(
+            taxonomy_file.read_bytes().decode("utf-8"),
+            tools_file.read_bytes().decode("utf-8"),
+            self.ontology_prefix_iri, self.tool_root, self.dimensions,
+            self.strictToolAnnotations)
+
+        self._ape: j_ape.APE | None = None
+        self._tool_count: int | None = None
+
+        # Java objects for polytypes, by their JSON encoding; only valid for 
+        # the domain setup of this instance
+        self._json_types: dict[str, j_json.JSONObject] = dict()
+        self._types: dict[tuple[str, bool], j_ape.models.Type] = dict()
+
+    @property
+    def ape(self) -> j_ape.APE:
+        """The APE object in the JVM, set up on first use."""
+        if self._ape is None:
+            start_ape(jvm_args=self.jvm_args)
+            self.config = j_ape.configuration.APECoreConfig(
+                j_io.File(str(self.taxonomy_file)),  # ontology
+                self.ontology_prefix_iri,  # ontologyPrefixIRI
+                self.tool_root,  # toolTaxonomyRoot
+                j_util.Arrays.asList(*self.dimensions),  # dataDimensionsRoots
+                j_io.File(str(self.tools_file)),  # toolAnnotations
+                self.strictToolAnnotations  # strictToolAnnotations
+            )
+            self._ape = j_ape.APE(self.config)
+        return self._ape
+
+    @property
+    def setup(self) -> j_ape.utils.APEDomainSetup:
+        return self.ape.getDomainSetup()
 
     def json_type(self, t: Polytype) -> j_json.Object:
-        obj = j_json.JSONObject()
-        for dimension, classes in t.items():
-            array = j_json.JSONArray()
-            for c in classes:
-                array.put(str(c))
-            obj.put(str(dimension), array)
-        return obj
+        key = json.dumps(polytype2json(t))
+        try:
+            return self._json_types[key]
+        except KeyError:
+            obj = j_json.JSONObject()
+            for dimension, classes in t.items():
+                array = j_json.JSONArray()
+                for c in classes:
+                    array.put(str(c))
+                obj.put(str(dimension), array)
+            self._json_types[key] = obj
+            return obj
 
     def type(self, is_output: bool, t: Polytype) -> j_ape.models.Type:
-        """Convert `Polytype` to the corresponding APE structure."""
-
-        return j_ape.models.Type.taxonomyInstanceFromJson(
-            self.json_type(t), self.setup, is_output)
-
-    def constraint(self, use_t: Iterable[Polytype]) -> j_json.JSONObject:
-        """Add the 'use_t' constraint for the given types."""
-        # TODO: Make a 'real' Constraint wrapper for other types of 
-        # constraints. Just rushing through things atm
-        result = j_json.JSONObject()
-        constraints = j_json.JSONArray()
-        for pt in use_t:
-            obj = j_json.JSONObject()
-            obj.put("constraintid", "use_t")
-            types = j_json.JSONArray()
-            types.put(self.json_type(pt))
-            obj.put("parameters", types)
-            constraints.put(obj)
-        result.put("constraints", constraints)
-        return result
+        """Convert `Polytype` to the corresponding APE structure. The same 
+        polytypes recur across many runs, so the result is remembered."""
+
+        key = (json.dumps(polytype2json(t)), is_output)
+        try:
+            return self._types[key]
+        except KeyError:
+            result = self._types[key] = \
+                j_ape.models.Type.taxonomyInstanceFromJson(
+                    self.json_type(t), self.setup, is_output)
+            return result
+
+    @staticmethod
+    def constraint(use_t: Iterable[Polytype]) -> dict:
+        """Add the 'use_t' constraint for the given types. For other 
+        constraints, see `Constraint`."""
+        return {"constraints": [
+            Constraint("use_t", pt).to_json()
+            for pt in use_t
+        ]}
 
     def type_array(self, is_output: bool,
             types: Iterable[Polytype]) -> j_json.JSONArray:
@@ -146,8 +252,44 @@ class APE(object):
             solutions: int = 10,
             timeout: int = 600,
             use_workflow_input: typing.Literal["NONE", "ONE", "ALL"] = "ALL",
-            constraints: j_json.JSONObject = j_json.JSONObject(),
-            output_dir: Path = Path(".")) -> Iterator[Graph]:
+            constraints: j_json.JSONObject | dict | None = None,
+            output_dir: Path = Path("."),
+            first: int = 1,
+            run: str | None = None) -> Iterator[Graph]:
+        """Solutions are numbered from `first` onwards. Telemetry records of 
+        the same `run` share its identifier."""
+
+        inputs, outputs = list(inputs), list(outputs)
+        record: dict[str, Any] = dict(name=str(prefix),
+            run=run or run_id(), engine="ape",
+            tools=self.tool_count, inputs=len(inputs), outputs=len(outputs),
+            min_length=solution_length[0], max_length=solution_length[1],
+            timeout=timeout, cached=False, timed_out=False)
+        start = time.monotonic()
+
+        if self.cache:
+            key = SynthesisCache.key(self.digest,
+                [polytype2json(t) for t in inputs],
+                [polytype2json(t) for t in outputs],
+                constraints if isinstance(constraints, dict)
+                else json.loads(str(constraints) if constraints else "{}"),
+                solution_length, solutions, use_workflow_input)
+            cached = self.cache.get(key)
+            if cached is not None:
+                print("Using cached solutions for", prefix, file=sys.stderr)
+                workflows = [_Workflow.from_ntriples(
+                    data, URIRef(old_root), prefix + str(first + i))
+                    for i, (old_root, data) in enumerate(cached)]
+                self.record(record, start, workflows, cached=True)
+                yield from workflows
+                return
+
+        ape = self.ape
+        record['setup_seconds'] = time.monotonic() - start
+        if constraints is None:
+            constraints = j_json.JSONObject()
+        elif isinstance(constraints, dict):
+            constraints = j_json.JSONObject(json.dumps(constraints))
 
         inputs_ape = self.type_array(False, inputs)
         outputs_ape = self.type_array(False, outputs)
@@ -174,87 +316,170 @@ class APE(object):
             print('OUT:', self.json_type(x), file=sys.stderr)
         print("With constraints:", constraints, file=sys.stderr)
 
-        result = self.ape.runSynthesis(config)
-
-        for i in range(result.getNumberOfSolutions()):
-            uri: URIRef = prefix + str(i + 1)
-            wf = _Workflow(uri)
-            wf.add_wf(result.get(i))
-            yield wf
+        synthesis_start = time.monotonic()
+        record['config_seconds'] = synthesis_start - start \
+            - record['setup_seconds']
+        result = ape.runSynthesis(config)
+        conversion_start = time.monotonic()
+        record['synthesis_seconds'] = conversion_start - synthesis_start
+        timed_out = record['synthesis_seconds'] >= timeout
+
+        # Extract everything from Java before building graphs, so that the 
+        # Java objects can be released as soon as possible
+        converter = _Converter()
+        structures = [converter.extract(result.get(i))
+            for i in range(result.getNumberOfSolutions())]
+        del converter, result, config, inputs_ape, outputs_ape
+
+        workflows = [
+            _Workflow.from_structure(prefix + str(first + i), structure)
+            for i, structure in enumerate(structures)]
+        record['conversion_seconds'] = time.monotonic() - conversion_start
+        record['lengths'] = [len(apps) for _, _, apps in structures]
+
+        # Results that were cut short by the timeout could be completed on a 
+        # later run, so they are not cached
+        if self.cache and not (timed_out and len(workflows) < solutions):
+            self.cache.put(key, [(str(wf.root), wf.serialize(format="nt"))
+                for wf in workflows])
+
+        self.record(record, start, workflows, timed_out=timed_out)
+        yield from workflows
+
+    @property
+    def tool_count(self) -> int:
+        if self._tool_count is None:
+            with open(self.tools_file, 'r') as f:
+                self._tool_count = len(json.load(f)['functions'])
+        return self._tool_count
+
+    def record(self, record: dict[str, Any], start: float,
+            workflows: list[_Workflow], **kwargs: Any) -> None:
+        """Finish and write a telemetry record of a run."""
+        if self.telemetry:
+            record.update(kwargs, seconds=time.monotonic() - start,
+                solutions=len(workflows))
+            record.setdefault('lengths', [sum(1 for _ in
+                wf.objects(wf.root, WF.edge)) for wf in workflows])
+            self.telemetry.write(record)
 
 
 WF = Namespace("http://geographicknowledge.de/vocab/Workflow.rdf#")
 
 
-class _Workflow(Graph):
-    """
-    A single solution workflow represented as an RDF graph in the
-    <http://geographicknowledge.de/vocab/Workflow.rdf#> namespace.
-    """
-
-    def __init__(self, root: URIRef):
-        """
-        Create RDF graph from Java object.
-        """
-
-        super().__init__()
-
-        # Map APE's tool applications and resources to RDF ones
-        self.root: Node = root
-        self.apps: dict[j_ape.core.solutionStructure.ModuleNode, Node] = dict()
-        self.resources: dict[j_ape.models.Type, Node] = dict()
-
-    def add_wf(self, workflow: j_ape.core.solutionStructure.SolutionWorkflow):
-        self.add((self.root, RDF.type, WF.Workflow))
+# A solution extracted from Java as plain Python data: the types of each 
+# resource, the indices of the source resources, and, for each tool 
+# application, the tool along with the indices of its input and output 
+# resources
+Structure = tuple[
+    list[tuple[URIRef, ...]],
+    list[int],
+    list[tuple[URIRef, list[int], list[int]]]
+]
 
-        for source in workflow.getWorkflowInputTypeStates():
-            node = self.add_resource(source)
-            self.add((self.root, WF.source, node))
 
-        for module in workflow.getModuleNodes():
-            self.add_app(module)
+class _Converter(object):
+    """
+    Extracts APE's solutions from the JVM. Conversions of APE's types are 
+    remembered across all solutions of a run; once the run is converted, the 
+    converter should be dropped so that no Java objects are kept alive.
+    """
 
-    def add_app(self, module: j_ape.core.solutionStructure.ModuleNode) -> Node:
-        """
-        Add a blank node representing a tool module to the RDF graph, and
-        return it.
-        """
+    def __init__(self):
+        self.predicates: dict[Any, URIRef] = dict()
 
+    def predicate(self, t: j_ape.models.TaxonomyPredicate) -> URIRef:
         try:
-            return self.apps[module]
+            return self.predicates[t]
         except KeyError:
-            app = BNode()
-            tool = URIRef(module.getNodeLongLabel())
-
-            self.add((self.root, WF.edge, app))
-            self.add((app, WF.applicationOf, tool))
-
-            for type in module.getInputTypes():
-                resource = self.add_resource(type)
-                self.add((app, WF.inputx, resource))
-
+            uri = self.predicates[t] = URIRef(t.getPredicateLongLabel())
+            return uri
+
+    def extract(self, workflow: j_ape.core.solutionStructure.SolutionWorkflow
+            ) -> Structure:
+        resources: list[tuple[URIRef, ...]] = []
+        index: dict[Any, int] = dict()
+
+        def resource(type: j_ape.models.Type,
+                types: tuple[URIRef, ...] | None = None) -> int:
+            try:
+                return index[type]
+            except KeyError:
+                if types is None:
+                    types = tuple(self.predicate(t) for t in type.getTypes())
+                index[type] = len(resources)
+                resources.append(types)
+                return index[type]
+
+        sources = [resource(source)
+            for source in workflow.getWorkflowInputTypeStates()]
+
+        apps = []
+        for module in workflow.getModuleNodes():
+            inputs = [resource(type) for type in module.getInputTypes()]
+            outputs = []
             for type in module.getOutputTypes():
                 # Workaround: there's often an empty output for some reason
-                if not list(type.getTypes()):
+                types = tuple(self.predicate(t) for t in type.getTypes())
+                if not types:
                     break
-                resource = self.add_resource(type)
-                self.add((app, WF.output, resource))
+                outputs.append(resource(type, types))
+            apps.append((URIRef(module.getNodeLongLabel()), inputs, outputs))
 
-            return app
+        return resources, sources, apps
 
-    def add_resource(self, type: j_ape.models.Type) -> Node:
-        """
-        Add a blank node representing a resource of the given type to the RDF
-        graph, and return it.
-        """
-        try:
-            return self.resources[type]
-        except KeyError:
-            resource = self.resources[type] = BNode()
-            type_labels = []
-            for t in type.getTypes():
-                type_node = URIRef(t.getPredicateLongLabel())
-                type_labels.append(shorten(type_node))
-                self.add((resource, RDF.type, type_node))
-            self.add((resource, RDFS.label, Literal(", ".join(type_labels))))
-            return resource
+
+class _Workflow(Graph):
+    """
+    A single solution workflow represented as an RDF graph in the
+    <http://geographicknowledge.de/vocab/Workflow.rdf#> namespace.
+    """
+
+    # Labels are the same across solutions, so they need only be made once
+    labels: dict[tuple[URIRef, ...], Literal] = dict()
+
+    def __init__(self, root: URIRef):
+        super().__init__()
+        self.root: Node = root
+
+    @staticmethod
+    def from_ntriples(data: str, old_root: URIRef, root: URIRef) -> _Workflow:
+        """Restore a workflow serialized as N-Triples under a new root."""
+        g = Graph()
+        g.parse(data=data, format="nt")
+        wf = _Workflow(root)
+        for s, p, o in g:
+            wf.add((root if s == old_root else s, p,
+                root if o == old_root else o))
+        return wf
+
+    @staticmethod
+    def from_structure(root: URIRef, structure: Structure) -> _Workflow:
+        """Create an RDF graph from a solution extracted by `_Converter`."""
+        wf = _Workflow(root)
+        resource_types, sources, apps = structure
+        wf.add((root, RDF.type, WF.Workflow))
+
+        resources = [BNode() for _ in resource_types]
+        for resource, types in zip(resources, resource_types):
+            for t in types:
+                wf.add((resource, RDF.type, t))
+            try:
+                label = _Workflow.labels[types]
+            except KeyError:
+                label = _Workflow.labels[types] = Literal(
+                    ", ".join(shorten(t) for t in types))
+            wf.add((resource, RDFS.label, label))
+
+        for i in sources:
+            wf.add((root, WF.source, resources[i]))
+
+        for tool, inputs, outputs in apps:
+            app = BNode()
+            wf.add((root, WF.edge, app))
+            wf.add((app, WF.applicationOf, tool))
+            for i in inputs:
+                wf.add((app, WF.inputx, resources[i]))
+            for i in outputs:
+                wf.add((app, WF.output, resources[i]))
+        return wf
@@ -0,0 +1,76 @@
+"""
+An on-disk cache for synthesis results. Results are addressed by a hash of
+everything that determines them, so that a run with the same domain and the
+same specification can skip the search altogether.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Any
+
+
+class SynthesisCache(object):
+    """A directory of cached results, one file per key. When the directory
+    grows beyond `max_size` bytes, the least recently used entries are
+    evicted."""
+
+    def __init__(self, directory: Path, max_size: int = 1 << 30):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """Hash JSON-compatible values into a key."""
+        data = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> list[tuple[str, str]] | None:
+        """Return the cached solutions as pairs of the root of each workflow
+        and the workflow as N-Triples, or `None` if there is no entry."""
+        path = self.path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return [(root, data) for root, data in entry]
+
+    def put(self, key: str, solutions: list[tuple[str, str]]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(solutions, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits."""
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
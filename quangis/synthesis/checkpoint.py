@@ -0,0 +1,55 @@
+"""
+Checkpoints for long batches of synthesis jobs, so that a batch that was
+interrupted can be resumed without redoing the jobs that were finished.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+from pathlib import Path
+from typing import Any
+
+
+class Checkpoint(object):
+    """A manifest of the jobs in a batch that are done, with the number of
+    solutions and the files that were written for each. The manifest
+    belongs to a `key` that identifies the input of the batch (see
+    `SynthesisCache.key()`); if the key has changed since the manifest was
+    written, the batch starts over. Once the batch is finished, the manifest
+    should be removed, so that it only ever applies to interrupted runs."""
+
+    def __init__(self, path: Path, key: str):
+        self.path = path
+        self.key = key
+        self.jobs: dict[str, dict[str, Any]] = dict()
+        self.resumed = False
+
+        try:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if manifest.get('key') == key:
+            self.jobs = manifest['jobs']
+            self.resumed = True
+
+    def done(self, name: str) -> bool:
+        return name in self.jobs
+
+    def complete(self, name: str, solutions: int,
+            outputs: list[Path]) -> None:
+        """Record that a job is done. The manifest is replaced atomically, so
+        it only ever mentions jobs whose output was completely written."""
+        self.jobs[name] = dict(solutions=solutions,
+            outputs=[str(p) for p in outputs])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(dict(key=self.key, jobs=self.jobs), f, indent=4)
+        os.replace(tmp, self.path)
+
+    def remove(self) -> None:
+        """Forget about the batch, once it is finished."""
+        self.jobs = dict()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,147 @@
+"""
+Constraints on the workflows that APE may synthesize, following APE's
+constraint templates:
+<https://ape-framework.readthedocs.io/en/v1.1.12/docs/specifications/constraints.html>
+
+Constraints are passed around in the JSON format that APE understands, so
+that they can be cached and sent to other processes; the `Constraint` class
+is a typed way to build and read them.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Mapping, Any
+from rdflib.term import Node, URIRef
+from transforge.type import TypingError
+from transforge.expr import Application, Operation, Source, ApplicationError
+from transforge.lang import Language, ParseError
+
+from quangis.cct import cct
+from quangis.polytype import Polytype
+from quangis.synthesis.job import polytype2json
+from quangis.synthesis.signature import ToolSignatures
+
+"""Pairs of CCT operators that undo one another."""
+INVERSE_OPERATORS = [
+    ("reify", "deify"),
+    ("invert", "revert"),
+    ("nest", "get"),
+    ("objectify", "nominalize"),
+]
+
+
+def sole_operator(expr: str, inputs: int = 1,
+        language: Language = cct) -> str | None:
+    """The name of the operator that an expression consists of, if it is 
+    nothing but that operator applied to an input; otherwise `None`."""
+    try:
+        e = language.parse(expr, *(Source() for _ in range(inputs)))
+    except (ParseError, TypingError, ApplicationError, IndexError):
+        return None
+    if isinstance(e, Application) and isinstance(e.f, Operation) \
+            and isinstance(e.x, Source):
+        return e.f.operator.name
+    return None
+
+
+"""Templates that take operations (tools) as parameters, along with the
+number of parameters."""
+MODULE_TEMPLATES = {
+    "use_m": 1,  # Use operation
+    "nuse_m": 1,  # Do not use operation
+    "last_m": 1,  # Use operation as the last one
+    "ite_m": 2,  # If the first is used, the second must be used afterwards
+    "itn_m": 2,  # If the first is used, the second must not be used after
+    "depend_m": 2,  # If the first is used, the second must be used before
+    "next_m": 2,  # If the first is used, the second must be used next
+    "prev_m": 2,  # If the first is used, the second must be used just before
+    "connected_op": 2,  # The output of the first must go to the second one
+    "not_connected_op": 2,  # The output of the first must not go there
+    "not_repeat_op": 1,  # No operation in this subtree is used twice
+}
+
+"""Templates that take types as parameters, along with the number of
+parameters."""
+TYPE_TEMPLATES = {
+    "use_t": 1,  # Use type as input to some operation
+    "gen_t": 1,  # Generate type as output of some operation
+    "nuse_t": 1,  # Do not use type
+    "ngen_t": 1,  # Do not generate type
+    "use_ite_t": 2,  # If the first is used, the second must be used afterwards
+    "gen_ite_t": 2,  # If the first is made, the second must be made afterwards
+    "use_itn_t": 2,  # If the first is used, the second must not be used after
+    "gen_itn_t": 2,  # If the first is made, the second must not be made after
+}
+
+
+class Constraint(object):
+    """A single instance of a constraint template. Parameters are either
+    tools or types, depending on the template."""
+
+    def __init__(self, id: str, *parameters: URIRef | Polytype):
+        if id in MODULE_TEMPLATES:
+            n = MODULE_TEMPLATES[id]
+            valid = all(isinstance(p, URIRef) for p in parameters)
+        elif id in TYPE_TEMPLATES:
+            n = TYPE_TEMPLATES[id]
+            valid = all(isinstance(p, Polytype) for p in parameters)
+        else:
+            raise ValueError(f"Unknown constraint template {id}")
+        if not valid or len(parameters) != n:
+            raise ValueError(f"Wrong parameters for constraint {id}")
+        self.id = id
+        self.parameters = list(parameters)
+
+    def __str__(self) -> str:
+        return f"{self.id}({', '.join(str(p) for p in self.parameters)})"
+
+    def to_json(self, tool_root: Node | None = None) -> dict[str, Any]:
+        """Tools are given in APE's format as belonging to the taxonomy at 
+        `tool_root`, so it is needed only for tool constraints."""
+        if self.id in MODULE_TEMPLATES and tool_root is None:
+            raise ValueError(f"Constraint {self.id} needs a tool root")
+        return {"constraintid": self.id, "parameters": [
+            {str(tool_root): [str(p)]} if isinstance(p, URIRef)
+            else polytype2json(p) for p in self.parameters]}
+
+    @staticmethod
+    def from_json(obj: Mapping[str, Any]) \
+            -> tuple[str, list[list[URIRef] | Mapping[str, list[str]]]]:
+        """Read a constraint in APE's format, without converting its types to
+        polytypes. Parameters of tool constraints are given as lists of
+        tools."""
+        id = obj['constraintid']
+        if id in MODULE_TEMPLATES:
+            return id, [[URIRef(t) for ts in p.values() for t in ts]
+                for p in obj['parameters']]
+        return id, obj['parameters']
+
+    @staticmethod
+    def all_json(constraints: Iterable[Constraint], tool_root: Node,
+            base: Mapping[str, Any] | None = None) -> dict[str, Any]:
+        """Combine constraints into APE's format, added to any constraints
+        that are already in that format."""
+        return {"constraints": list((base or {}).get("constraints", ()))
+            + [c.to_json(tool_root) for c in constraints]}
+
+    @staticmethod
+    def automatic(signatures: ToolSignatures,
+            inputs: Iterable[Polytype], outputs: Iterable[Polytype],
+            max_length: int,
+            inverses: Iterable[tuple[URIRef, URIRef]] = (),
+            irrelevant: bool = True) -> list[Constraint]:
+        """Derive constraints that only rule out useless workflows, so that 
+        APE can discard them early: tools that cannot lie on a path from the 
+        inputs to the outputs are not used (unless `irrelevant` is false, for 
+        instance because such tools were already pruned), and the output of a 
+        tool is never passed directly to its inverse."""
+        relevant = signatures.relevant(inputs, outputs, max_length)
+        result: list[Constraint] = []
+        if irrelevant:
+            result.extend(Constraint("nuse_m", URIRef(tool))
+                for tool in sorted(signatures.inputs)
+                if tool not in relevant)
+        result.extend(Constraint("not_connected_op", a, b)
+            for a, b in inverses
+            if str(a) in relevant and str(b) in relevant)
+        return result
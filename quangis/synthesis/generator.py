@@ -2,16 +2,43 @@
 
 from __future__ import annotations
 
+import os
+import sys
+import json
+import time
+import typing
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from rdflib import Graph
+from typing import Iterable, Iterator
+from rdflib import Graph, URIRef
 from rdflib.util import guess_format
 from itertools import chain
-from transforge.namespace import shorten
+from transforge.namespace import EX, shorten
 
 from quangis.ccd import ccd
 from quangis.polytype import Polytype
-from quangis.namespace import CCD, TOOL, OWL, RDF, RDFS, ADA
+from quangis.namespace import CCD, CCT, TOOL, OWL, RDF, RDFS, ADA
 from quangis.synthesis.ape import APE, ToolsDict
+from quangis.synthesis.cache import SynthesisCache
+from quangis.synthesis.telemetry import Telemetry, run_id
+from quangis.synthesis.signature import ToolSignatures
+from quangis.synthesis.search import NativeSynthesis
+from quangis.synthesis.constraint import Constraint, INVERSE_OPERATORS, \
+    sole_operator
+
+
+@contextmanager
+def atomic(path: Path) -> Iterator[Path]:
+    """Provide a temporary path that replaces `path` once it is written."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
 
 class WorkflowGenerator(APE):
     """
@@ -19,30 +46,278 @@ class WorkflowGenerator(APE):
     the form we want it to.
     """
 
-    def __init__(self, *tools: Path, build_dir: Path):
-        print(tools)
-        self.tools = Graph()
-        for path in tools:
-            self.tools.parse(path, format=guess_format(str(path)))
+    # Number of instances of APE for pruned sets of tools to keep around
+    max_pruned = 4
+
+    # Part of the timeout that a guided search without APE may take, so that 
+    # there is always time left to fall back to APE
+    guided_share = 0.5
+
+    def __init__(self, *tools: Path, build_dir: Path,
+            jvm_args: Iterable[str] = (),
+            cache: SynthesisCache | None = None,
+            telemetry: Telemetry | None = None,
+            debug: bool = False):
+        """The taxonomy and tool annotations that APE needs are derived only 
+        once for every version of the tool files and the CCD ontology; they 
+        are kept in a subdirectory of `build_dir` named after a hash of those 
+        files. With `debug`, the intermediate taxonomies and dimensions are 
+        also written there, for troubleshooting."""
+
+        self.tool_files = [Path(p) for p in tools]
+        self._tools: Graph | None = None
+        self._signatures: ToolSignatures | None = None
+        self._pruned: OrderedDict[frozenset[str], APE] = OrderedDict()
+        self._native: NativeSynthesis | None = None
+        self._inverses: list[tuple[URIRef, URIRef]] | None = None
+
+        digest = hashlib.sha256()
+        for path in chain([ccd.path], self.tool_files):
+            digest.update(path.read_bytes())
+        self.artefact_dir = build_dir / digest.hexdigest()[:16]
+        taxonomy_file = self.artefact_dir / "taxonomy.rdf"
+        tools_file = self.artefact_dir / "tools.json"
 
-        typetax = self.ape_type_taxonomy()
-        tooltax = self.ape_tool_taxonomy()
+        if not (taxonomy_file.exists() and tools_file.exists()):
+            print(f"Deriving APE domain in {self.artefact_dir}",
+                file=sys.stderr)
+            self.artefact_dir.mkdir(parents=True, exist_ok=True)
+            typetax = self.ape_type_taxonomy()
+            tooltax = self.ape_tool_taxonomy()
+            if debug:
+                for d in ccd.dimensions:
+                    d.graph.serialize(self.artefact_dir /
+                        f"dimension_{shorten(d.root)}.ttl")
+                typetax.serialize(self.artefact_dir / "taxonomy_types.ttl")
+                tooltax.serialize(self.artefact_dir / "taxonomy_tools.ttl")
 
-        # Purely for troubleshooting
-        for d in ccd.dimensions:
-            d.graph.serialize(build_dir / f"dimension_{shorten(d.root)}.ttl")
-        typetax.serialize(build_dir / "taxonomy_types.ttl")
-        tooltax.serialize(build_dir / "taxonomy_tools.ttl")
+            # Write atomically, since other processes may be doing the same
+            with atomic(tools_file) as tmp:
+                with open(tmp, 'w') as f:
+                    json.dump(self.ape_tools(), f, indent=4)
+            with atomic(taxonomy_file) as tmp:
+                (typetax + tooltax).serialize(destination=tmp, format='xml')
 
         super().__init__(
-            taxonomy=typetax + tooltax,
-            tools=self.ape_tools(),
+            taxonomy=taxonomy_file,
+            tools=tools_file,
             tool_root=TOOL.Abstraction,
             ontology_prefix_iri=CCD,
             build_dir=build_dir,
-            dimensions=[d.root for d in ccd.dimensions]
+            dimensions=[d.root for d in ccd.dimensions],
+            jvm_args=jvm_args,
+            cache=cache,
+            telemetry=telemetry
         )
 
+    @property
+    def tools(self) -> Graph:
+        """The tool annotation graph, which is only parsed when needed."""
+        if self._tools is None:
+            self._tools = Graph()
+            for path in self.tool_files:
+                self._tools.parse(path, format=guess_format(str(path)))
+        return self._tools
+
+    @property
+    def signatures(self) -> ToolSignatures:
+        if self._signatures is None:
+            self._signatures = ToolSignatures.from_file(self.tools_file)
+        return self._signatures
+
+    def pruned(self, inputs: list[Polytype], outputs: list[Polytype],
+            max_length: int) -> APE | None:
+        """Obtain an instance of APE that only knows about those tools that 
+        could occur in a workflow for the given specification, or `None` if 
+        there are no such tools. The taxonomy is shared with the full 
+        instance, which is harmless since APE only considers the tools in its 
+        annotation file."""
+
+        relevant = frozenset(self.signatures.relevant(
+            inputs, outputs, max_length))
+        if not relevant:
+            return None
+        elif len(relevant) == len(self.signatures.inputs):
+            return self
+
+        print(f"Keeping {len(relevant)} of {len(self.signatures.inputs)} "
+            f"tools", file=sys.stderr)
+        try:
+            self._pruned.move_to_end(relevant)
+            return self._pruned[relevant]
+        except KeyError:
+            pass
+
+        with open(self.tools_file, 'r') as f:
+            tools = json.load(f)
+        tools['functions'] = [tool for tool in tools['functions']
+            if tool['id'] in relevant]
+        tools_file = self.artefact_dir / "pruned" / \
+            f"{SynthesisCache.key(sorted(relevant))[:16]}.json"
+        if not tools_file.exists():
+            tools_file.parent.mkdir(exist_ok=True)
+            with atomic(tools_file) as tmp:
+                with open(tmp, 'w') as f:
+                    json.dump(tools, f, indent=4)
+
+        # Every instance may hold a JVM-side domain setup, so only a few
+        # are kept around
+        while len(self._pruned) >= self.max_pruned:
+            self._pruned.popitem(last=False)
+        ape = self._pruned[relevant] = APE(
+            taxonomy=self.taxonomy_file,
+            tools=tools_file,
+            tool_root=URIRef(self.tool_root),
+            ontology_prefix_iri=self.ontology_prefix_iri,
+            dimensions=[URIRef(d) for d in self.dimensions],
+            strictToolAnnotations=self.strictToolAnnotations,
+            jvm_args=self.jvm_args,
+            cache=self.cache,
+            telemetry=self.telemetry)
+        return ape
+
+    def run(self,
+            inputs: Iterable[Polytype],
+            outputs: Iterable[Polytype],
+            prefix: URIRef = EX["solution"],
+            solution_length: tuple[int, int] = (1, 10),
+            solutions: int = 10,
+            timeout: int = 600,
+            use_workflow_input: typing.Literal["NONE", "ONE", "ALL"] = "ALL",
+            constraints: dict | None = None,
+            output_dir: Path = Path("."),
+            first: int = 1,
+            run: str | None = None,
+            prune: bool = True,
+            native: bool = True,
+            guide: Iterable[Polytype] = (),
+            restrict: bool = True) -> Iterator[Graph]:
+        """As `APE.run()`, but with `prune`, APE is only told about the tools 
+        that could possibly occur in a solution (see `ToolSignatures`). With 
+        `native`, solutions of up to `NativeSynthesis.max_length` steps are 
+        searched for without APE, which is then only started if more or 
+        longer solutions are needed.
+
+        A `guide` is a chain of types through which solutions should pass. It 
+        is first used to direct a native search (see `NativeSynthesis`) for 
+        at most `guided_share` of the timeout; only if that finds nothing, 
+        the types are passed to APE as 'use_t' constraints.
+
+        With `restrict`, constraints that rule out useless workflows are 
+        added (see `Constraint.automatic()`). Solutions are numbered from 
+        `first`. The native search and APE record their parts of the work 
+        under the same `run`."""
+
+        inputs, outputs, guide = list(inputs), list(outputs), list(guide)
+        run = run or run_id()
+        lo, hi = solution_length
+        found = 0
+        deadline = time.monotonic() + timeout
+
+        if restrict:
+            constraints = Constraint.all_json(Constraint.automatic(
+                self.signatures, inputs, outputs, hi,
+                inverses=self.inverses(), irrelevant=not prune),
+                URIRef(self.tool_root), constraints)
+
+        if native and self._native is None:
+            self._native = NativeSynthesis(self.signatures,
+                telemetry=self.telemetry)
+        engine = self._native if native else None
+
+        if guide:
+            if engine and engine.supports(constraints):
+                for wf in engine.run(inputs, outputs, prefix=prefix,
+                        solution_length=solution_length, solutions=solutions,
+                        timeout=max(1, int(timeout * self.guided_share)),
+                        use_workflow_input=use_workflow_input,
+                        constraints=constraints, guide=guide,
+                        first=first, run=run):
+                    yield wf
+                    found += 1
+                if found:
+                    return
+            constraints = {"constraints":
+                (constraints or {}).get("constraints", [])
+                + self.constraint(guide)["constraints"]}
+
+        if engine and lo <= NativeSynthesis.max_length \
+                and engine.supports(constraints):
+            for wf in engine.run(inputs, outputs, prefix=prefix,
+                    solution_length=(lo, min(hi, NativeSynthesis.max_length)),
+                    solutions=solutions,
+                    timeout=max(1, int(deadline - time.monotonic())),
+                    use_workflow_input=use_workflow_input,
+                    constraints=constraints, first=first + found,
+                    run=run):
+                yield wf
+                found += 1
+            lo = NativeSynthesis.max_length + 1
+            if found >= solutions or lo > hi or time.monotonic() > deadline:
+                return
+
+        ape = self.pruned(inputs, outputs, hi) if prune else self
+        if ape is None:
+            print(f"No tools lead from the inputs to the outputs of "
+                f"{prefix}", file=sys.stderr)
+            return
+        synthesize = super().run if ape is self else ape.run
+        yield from synthesize(inputs, outputs, prefix=prefix,
+            solution_length=(lo, hi), solutions=solutions - found,
+            timeout=max(1, int(deadline - time.monotonic())),
+            use_workflow_input=use_workflow_input,
+            constraints=constraints, output_dir=output_dir,
+            first=first + found, run=run)
+
+    def inverses(self) -> list[tuple[URIRef, URIRef]]:
+        """Find pairs of tools of which the second undoes the first: the CCT 
+        expressions of both are nothing but an operator applied to their 
+        input, and those operators are each other's inverse (see 
+        `INVERSE_OPERATORS`). Tools that do more than that are never paired, 
+        even if their expressions use such operators."""
+        if self._inverses is None:
+            inverse = dict(INVERSE_OPERATORS)
+            inverse.update((b, a) for a, b in INVERSE_OPERATORS)
+            operators: dict[URIRef, str] = dict()
+            for tool, expr in self.tools.subject_objects(CCT.expression):
+                assert isinstance(tool, URIRef)
+                if (tool, TOOL.implementation, None) not in self.tools:
+                    continue
+                op = sole_operator(str(expr),
+                    len(set(self.tools.objects(tool, TOOL.input))))
+                if op in inverse:
+                    operators[tool] = op
+            self._inverses = [(a, b)
+                for a, x in sorted(operators.items())
+                for b, y in sorted(operators.items()) if inverse[x] == y]
+        return self._inverses
+
+    def benchmark(self, inputs: Iterable[Polytype],
+            outputs: Iterable[Polytype],
+            solution_length: tuple[int, int] = (1, 10),
+            solutions: int = 10,
+            timeout: int = 600) -> dict[str, tuple[float, int]]:
+        """Time APE on the full set of tools with and without the constraints 
+        of `Constraint.automatic()`, bypassing the cache. Returns the number 
+        of seconds and solutions for each."""
+        inputs, outputs = list(inputs), list(outputs)
+        automatic = Constraint.all_json(Constraint.automatic(
+            self.signatures, inputs, outputs, solution_length[1],
+            inverses=self.inverses()), URIRef(self.tool_root))
+        cache, self.cache = self.cache, None
+        result = dict()
+        try:
+            for label, constraints in (("plain", None),
+                    ("constrained", automatic)):
+                start = time.monotonic()
+                n = sum(1 for _ in APE.run(self, inputs, outputs,
+                    solution_length=solution_length, solutions=solutions,
+                    timeout=timeout, constraints=constraints))
+                result[label] = (time.monotonic() - start, n)
+        finally:
+            self.cache = cache
+        return result
+
     def ape_tools(self) -> ToolsDict:
         """
         Convert tool annotation graph into a dictionary that APE understands.
@@ -0,0 +1,124 @@
+"""
+A synthesis job bundles everything that is needed for a single call to
+`APE.run`, in a form that can be sent to other processes.
+"""
+
+from __future__ import annotations
+
+import typing
+from typing import Iterable, Mapping, Any
+from rdflib.term import URIRef
+
+from quangis.ccd import ccd
+from quangis.polytype import Polytype, Dimension
+from quangis.namespace import EX
+
+
+def polytype2json(t: Polytype) -> dict[str, list[str]]:
+    """Convert a `Polytype` to a JSON-compatible dictionary, with dimensions
+    and classes sorted so that equal types have equal representations."""
+    return {str(d): sorted(str(c) for c in cs)
+        for d, cs in sorted(t.items())}
+
+
+def json2polytype(obj: Mapping[str, Iterable[str]],
+        dimensions: Iterable[Dimension] = ccd.dimensions) -> Polytype:
+    dims = {d.root: d for d in dimensions}
+    return Polytype({dims[URIRef(d)]: (URIRef(c) for c in cs)
+        for d, cs in obj.items()})
+
+
+class SynthesisJob(object):
+    """An input/output specification for APE, along with the parameters with
+    which it should be run."""
+
+    def __init__(self, name: str,
+            inputs: Iterable[Polytype],
+            outputs: Iterable[Polytype],
+            prefix: URIRef | None = None,
+            solution_length: tuple[int, int] = (1, 10),
+            solutions: int = 10,
+            timeout: int = 600,
+            use_workflow_input: typing.Literal["NONE", "ONE", "ALL"] = "ALL",
+            constraints: dict[str, Any] | None = None,
+            guide: Iterable[Polytype] = (),
+            first: int = 1,
+            run: str | None = None):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.prefix = prefix or EX[name]
+        self.solution_length = solution_length
+        self.solutions = solutions
+        self.timeout = timeout
+        self.use_workflow_input = use_workflow_input
+        self.constraints = constraints
+        self.guide = list(guide)
+        self.first = first
+        self.run = run
+
+    def __str__(self) -> str:
+        return self.name
+
+    def kwargs(self) -> dict[str, Any]:
+        """Keyword arguments for `APE.run`. A `guide` is only understood by
+        `WorkflowGenerator.run`, so it is only included if there is one; the 
+        same goes for the identifier of a `run`."""
+        kwargs: dict[str, Any] = dict(
+            inputs=self.inputs,
+            outputs=self.outputs,
+            prefix=self.prefix,
+            solution_length=self.solution_length,
+            solutions=self.solutions,
+            timeout=self.timeout,
+            use_workflow_input=self.use_workflow_input,
+            constraints=self.constraints,
+            first=self.first)
+        if self.guide:
+            kwargs['guide'] = self.guide
+        if self.run:
+            kwargs['run'] = self.run
+        return kwargs
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(
+            name=self.name,
+            inputs=[polytype2json(t) for t in self.inputs],
+            outputs=[polytype2json(t) for t in self.outputs],
+            prefix=str(self.prefix),
+            solution_length=list(self.solution_length),
+            solutions=self.solutions,
+            timeout=self.timeout,
+            use_workflow_input=self.use_workflow_input,
+            constraints=self.constraints,
+            guide=[polytype2json(t) for t in self.guide],
+            first=self.first,
+            run=self.run)
+
+    @staticmethod
+    def from_json(obj: Mapping[str, Any],
+            dimensions: Iterable[Dimension] = ccd.dimensions) -> SynthesisJob:
+        dimensions = list(dimensions)
+        lo, hi = obj['solution_length']
+        return SynthesisJob(
+            name=obj['name'],
+            inputs=[json2polytype(t, dimensions) for t in obj['inputs']],
+            outputs=[json2polytype(t, dimensions) for t in obj['outputs']],
+            prefix=URIRef(obj['prefix']),
+            solution_length=(lo, hi),
+            solutions=obj['solutions'],
+            timeout=obj['timeout'],
+            use_workflow_input=obj['use_workflow_input'],
+            constraints=obj['constraints'],
+            guide=[json2polytype(t, dimensions)
+                for t in obj.get('guide', ())],
+            first=obj.get('first', 1),
+            run=obj.get('run'))
+
+    # Polytypes carry their dimension graphs around, which we don't want to
+    # send to other processes
+    def __getstate__(self) -> dict[str, Any]:
+        return self.to_json()
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(SynthesisJob.from_json(state).__dict__)
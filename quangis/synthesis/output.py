@@ -0,0 +1,68 @@
+"""
+Writing synthesis results as soon as they are produced. N-Triples can simply
+be appended to, so results never have to be collected in memory, and nothing
+is written more than once.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import IO, Iterable
+from rdflib import Graph
+from rdflib.term import Node
+
+
+class TripleWriter(object):
+    """Appends graphs and triples to an N-Triples file. Unless `append` is
+    set, the file is written under a temporary name and only moved into
+    place once the writer is closed without errors, so that an interrupted
+    run does not leave a complete-looking file behind."""
+
+    def __init__(self, path: Path, append: bool = False):
+        self.path = path
+        self.target = path if append else \
+            path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        self.count = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file: IO[bytes] = open(self.target, 'ab' if append else 'wb')
+
+    def write(self, graph: Graph) -> None:
+        self.file.write(graph.serialize(format="nt", encoding="utf-8"))
+        self.file.flush()
+        self.count += len(graph)
+
+    def add(self, *triples: tuple[Node, Node, Node]) -> None:
+        g = Graph()
+        for triple in triples:
+            g.add(triple)
+        self.write(g)
+
+    def close(self) -> None:
+        self.file.close()
+        if self.target != self.path:
+            os.replace(self.target, self.path)
+
+    def discard(self) -> None:
+        """Close the file without moving it into place."""
+        self.file.close()
+        if self.target != self.path:
+            self.target.unlink(missing_ok=True)
+
+    def __enter__(self) -> TripleWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_triples(path: Path, graphs: Iterable[Graph]) -> int:
+    """Stream graphs to an N-Triples file and return the number of
+    triples."""
+    with TripleWriter(path) as writer:
+        for g in graphs:
+            writer.write(g)
+    return writer.count
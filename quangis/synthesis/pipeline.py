@@ -0,0 +1,126 @@
+"""
+Overlapping synthesis with the post-processing of its solutions. APE spends
+its time in Java, which releases the GIL, so it can run in a thread while
+worker processes turn earlier solutions into their final form.
+"""
+
+from __future__ import annotations
+
+import threading
+import multiprocessing
+from queue import Queue, Empty, Full
+from concurrent.futures import ProcessPoolExecutor, Future, wait, \
+    FIRST_COMPLETED
+from typing import Any, Callable, Iterable, Iterator
+from rdflib import Graph
+
+from quangis.synthesis.job import SynthesisJob
+
+
+class SynthesisPipeline(object):
+    """Solutions are taken from a synthesis thread and handed to a pool of
+    worker processes as N-Triples, along with the root of the workflow, the
+    job and the number of the solution within the job. The worker calls
+    `process(root, ntriples, job, index)`; `initializer` can be used to load
+    whatever it needs only once per worker.
+
+    At most `backlog` solutions wait for post-processing at any time. When
+    post-processing is the slower stage, synthesis is paused rather than
+    letting solutions pile up in memory."""
+
+    def __init__(self, process: Callable[[str, str, SynthesisJob, int], Any],
+            processes: int | None = None,
+            initializer: Callable[..., None] | None = None,
+            initargs: tuple = (),
+            backlog: int = 16):
+        self.process = process
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.backlog = backlog
+
+    def run(self, solutions: Iterable[tuple[SynthesisJob, Graph | None]]) \
+            -> Iterator[tuple[SynthesisJob, Any]]:
+        """Take solutions in the manner of `SynthesisScheduler.run()` and
+        yield the results of post-processing them as they arrive, followed by
+        `(job, None)` once every solution of a job has been processed."""
+
+        queue: Queue = Queue(maxsize=self.backlog)
+        end = object()
+
+        # If the consumer stops early, the producer must not wait forever for 
+        # room in the queue
+        stop = threading.Event()
+
+        def put(item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def produce() -> None:
+            iterator = iter(solutions)
+            try:
+                for item in iterator:
+                    if not put(item):
+                        break
+            except BaseException as e:
+                put(e)
+            finally:
+                # Let a suspended synthesis clean up after itself
+                if stop.is_set() and hasattr(iterator, 'close'):
+                    iterator.close()
+                put(end)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+
+        pending: dict[str, list[Future]] = dict()
+        jobs: dict[str, SynthesisJob] = dict()
+        counts: dict[str, int] = dict()
+
+        def finished() -> Iterator[tuple[SynthesisJob, Any]]:
+            for name, futures in pending.items():
+                while futures and futures[0].done():
+                    yield jobs[name], futures.pop(0).result()
+
+        try:
+            with ProcessPoolExecutor(self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                    initargs=self.initargs) as executor:
+                while (item := queue.get()) is not end:
+                    if isinstance(item, BaseException):
+                        raise item
+                    job, wf = item
+                    jobs[job.name] = job
+                    futures = pending.setdefault(job.name, [])
+                    if wf is None:
+                        for future in futures:
+                            yield job, future.result()
+                        del pending[job.name]
+                        yield job, None
+                        continue
+
+                    index = counts.get(job.name, 0)
+                    counts[job.name] = index + 1
+                    futures.append(executor.submit(self.process, str(wf.root),
+                        wf.serialize(format="nt"), job, index))
+                    yield from finished()
+
+                    # Don't take on more work than the workers can handle
+                    outstanding = [f for fs in pending.values() for f in fs]
+                    if len(outstanding) >= self.backlog:
+                        wait(outstanding, return_when=FIRST_COMPLETED)
+                        yield from finished()
+        finally:
+            stop.set()
+            try:
+                while True:
+                    queue.get_nowait()
+            except Empty:
+                pass
+            thread.join()
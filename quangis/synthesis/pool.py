@@ -0,0 +1,161 @@
+"""
+JPype allows only a single JVM per process, so to run multiple APE jobs at the
+same time, we spread them across worker processes. Each worker keeps its own
+warmed-up `APE` instance around for all the jobs it is given.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import queue
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from typing import Callable, Iterable, Iterator, Any
+from rdflib import Graph, URIRef
+from rdflib.namespace import RDF
+
+from quangis.namespace import WF
+from quangis.synthesis.ape import APE, _Workflow
+from quangis.synthesis.job import SynthesisJob
+
+
+def _worker(wid: int, factory: Callable[[], APE],
+        jobs: multiprocessing.Queue, results: multiprocessing.Queue) -> None:
+    """Main loop of a worker process: build the APE instance once, then run
+    jobs until receiving `None`. Jobs with a `guide` need a
+    `WorkflowGenerator`. Solutions are streamed back as N-Triples."""
+
+    ape = factory()
+    results.put(("ready", wid, None, None))
+    while (item := jobs.get()) is not None:
+        index, job = item
+        try:
+            for wf in ape.run(**job.kwargs()):
+                results.put(("solution", wid, index,
+                    wf.serialize(format="nt")))
+        except Exception as e:
+            results.put(("error", wid, index, f"{type(e).__name__}: {e}"))
+        else:
+            results.put(("done", wid, index, None))
+
+
+class SynthesisPool(object):
+    """
+    Run synthesis jobs across a number of worker processes. A job that is
+    still running `grace` seconds after its own timeout is killed, along with
+    the worker that was running it; a fresh worker takes its place.
+    """
+
+    def __init__(self, factory: Callable[[], APE],
+            processes: int | None = None,
+            grace: int = 30):
+        """The `factory` constructs the `APE` instance in each worker, so it
+        must be picklable, e.g. `functools.partial(WorkflowGenerator, ...)`."""
+        self.factory = factory
+        self.processes = processes or os.cpu_count() or 1
+        self.grace = grace
+        self.context = multiprocessing.get_context("spawn")
+        self.failures: dict[str, str] = dict()
+
+    def _spawn(self, wid: int, results: multiprocessing.Queue) \
+            -> tuple[BaseProcess, multiprocessing.Queue]:
+        jobs = self.context.Queue()
+        process = self.context.Process(target=_worker,
+            args=(wid, self.factory, jobs, results), daemon=True)
+        process.start()
+        return process, jobs
+
+    def run(self, jobs: Iterable[SynthesisJob]) \
+            -> Iterator[tuple[SynthesisJob, Graph | None]]:
+        """Run the given jobs and yield solutions as soon as they arrive,
+        paired with the job they belong to. Once a job has finished, it is
+        yielded once more with `None` instead of a graph. Jobs that failed or
+        timed out are recorded in `self.failures`."""
+
+        pending = list(enumerate(jobs))
+        pending.reverse()
+        all_jobs = dict(pending)
+        if not pending:
+            return
+
+        results = self.context.Queue()
+        workers: dict[int, tuple[BaseProcess, multiprocessing.Queue]] = {
+            wid: self._spawn(wid, results)
+            for wid in range(min(self.processes, len(pending)))}
+        running: dict[int, tuple[int, float]] = dict()
+        warming = set(workers.keys())
+        finished = 0
+
+        def assign(wid: int) -> None:
+            if pending:
+                index, job = pending.pop()
+                running[wid] = index, time.monotonic()
+                workers[wid][1].put((index, job))
+            else:
+                workers[wid][1].put(None)
+
+        try:
+            while finished < len(all_jobs):
+                try:
+                    msg: tuple[str, int, Any, Any] = results.get(timeout=1)
+                except queue.Empty:
+                    msg = ("idle", -1, None, None)
+
+                kind, wid, index, data = msg
+                if kind in ("solution", "done", "error") and \
+                        running.get(wid, (None, 0.0))[0] != index:
+                    # Leftovers from a worker that has since been killed
+                    continue
+                elif kind == "ready":
+                    warming.discard(wid)
+                    assign(wid)
+                elif kind == "solution":
+                    yield all_jobs[index], _graph(data)
+                elif kind in ("done", "error"):
+                    del running[wid]
+                    if kind == "error":
+                        self.failures[all_jobs[index].name] = data
+                        print(f"Job {all_jobs[index]} failed: {data}",
+                            file=sys.stderr)
+                    finished += 1
+                    yield all_jobs[index], None
+                    assign(wid)
+
+                for wid in warming:
+                    if not workers[wid][0].is_alive():
+                        raise RuntimeError(
+                            f"Synthesis worker {wid} failed to start")
+
+                # Kill workers whose job took too long, or that died
+                now = time.monotonic()
+                for wid, (index, start) in list(running.items()):
+                    job = all_jobs[index]
+                    process = workers[wid][0]
+                    overdue = now - start > job.timeout + self.grace
+                    if overdue or not process.is_alive():
+                        reason = "timed out" if overdue else "crashed"
+                        print(f"Job {job} {reason}; restarting worker",
+                            file=sys.stderr)
+                        process.kill()
+                        del running[wid]
+                        self.failures[job.name] = reason
+                        finished += 1
+                        yield job, None
+                        workers[wid] = self._spawn(wid, results)
+                        warming.add(wid)
+        finally:
+            for process, jobqueue in workers.values():
+                if process.is_alive():
+                    process.kill()
+
+
+def _graph(data: str) -> Graph:
+    g = Graph()
+    g.parse(data=data, format="nt")
+    root = g.value(None, RDF.type, WF.Workflow, any=False)
+    assert isinstance(root, URIRef)
+    wf = _Workflow(root)
+    wf += g
+    return wf
@@ -0,0 +1,83 @@
+"""
+Post-processing of workflows that were synthesized for the tasks of a
+question: their inputs are put in the order that the tools expect, and their
+transformation graphs are derived. This is slow and independent for every
+workflow, so it is done in worker processes (see `SynthesisPipeline`), each
+of which loads the tools only once.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Mapping
+from rdflib import Graph, URIRef, Literal
+from rdflib.namespace import RDF, RDFS
+from transforge.namespace import TF
+from transforge.expr import ApplicationError
+from transforge.graph import WorkflowCompositionError
+
+from quangis.namespace import WF, bind_all
+from quangis.evaluation import read_transformation, ToolContext
+from quangis.tools.set import ToolSet, InputHackError
+from quangis.synthesis.job import SynthesisJob
+
+_repo: ToolSet | None = None
+_tools: ToolContext | None = None
+
+
+def load_tools(*paths: Path) -> None:
+    """Load the tools in this process; use as the initializer of workers."""
+    global _repo, _tools
+    _repo = ToolSet.from_file(*paths, check_integrity=True)
+    _tools = ToolContext(_repo.graph())
+
+
+def question_workflow(root: str, data: str, job: SynthesisJob, index: int,
+        destdir: Path, tasks: Mapping[str, tuple[str, list[str]]]) \
+        -> tuple[str, Path]:
+    """Turn a raw solution for a task into a transformation graph and write
+    it to `destdir`. The `tasks` give the task and its comments for every
+    job. Workflows that cannot be made sense of are written anyway, marked
+    as invalid. Return the root of the workflow and the path of the written
+    file."""
+
+    assert _repo is not None and _tools is not None, "Tools were not loaded"
+    task, comments = tasks[job.name]
+    wf_root = URIRef(root)
+    wf_raw = Graph()
+    wf_raw.parse(data=data, format="nt")
+
+    wf_raw.add((wf_root, TF.implements, URIRef(task)))
+    for comment in comments:
+        wf_raw.add((wf_root, RDFS.comment, Literal(comment)))
+    wf_raw.add((wf_root, RDFS.comment, Literal(
+        f"Out: {job.outputs[0]}\nIn: \n"
+        f"{' & '.join(str(s) for s in job.inputs)}")))
+
+    assert (None, RDF.type, WF.Workflow) in wf_raw
+
+    error: Exception | None = None
+    try:
+        wf: Graph = _repo.input_permutation_hack(wf_raw)
+    except InputHackError as e:
+        # TODO: Note that simply removing workflows that cannot be
+        # input-hacked means that we will likely overlook workflows that
+        # need e.g. two inputs of the same type
+        wf = wf_raw
+        error = e
+    else:
+        # Derive transformation graphs
+        try:
+            wf = read_transformation(wf, _tools)
+        except (WorkflowCompositionError, ApplicationError) as e:
+            error = e
+    if error is not None:
+        wf.remove((wf_root, RDF.type, WF.Workflow))
+        wf.add((wf_root, RDF.type, WF.InvalidWorkflow))
+        wf.add((wf_root, RDFS.comment, Literal(f"{type(error)}: {error}")))
+
+    bind_all(wf)
+    prefix = "invalid_" if error is not None else ""
+    path = destdir / f"{prefix}{job.name}_{index}.ttl"
+    wf.serialize(path, format="ttl")
+    return root, path
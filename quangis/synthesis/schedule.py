@@ -0,0 +1,154 @@
+"""
+Scheduling a batch of synthesis jobs within a shared time budget.
+
+Some specifications keep APE busy until it times out while others are solved
+in a second, so giving every job the same timeout wastes most of the time on
+a few jobs. Instead, the cost of every job is predicted from earlier runs, the
+most expensive jobs are started first and the budget is divided in proportion
+to the predictions.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from typing import Any, Iterable, Iterator
+from rdflib import Graph
+
+from quangis.synthesis.job import SynthesisJob
+from quangis.synthesis.signature import ToolSignatures
+from quangis.synthesis.telemetry import Telemetry, run_id
+
+
+class SynthesisScheduler(object):
+    """Divides a time budget over synthesis jobs. The budget defaults to the
+    sum of the timeouts of the jobs; the timeout of a job is never exceeded.
+
+    Past runs are read from the records of a `Telemetry` file, which the 
+    synthesizer itself should write to. A job that was run before is 
+    expected to take as long as it did then; for other jobs, the time is 
+    extrapolated from the `complexity()` of the runs in the records."""
+
+    def __init__(self, budget: float | None = None,
+            telemetry: Telemetry | None = None,
+            signatures: ToolSignatures | None = None,
+            step: int = 2,
+            min_timeout: int = 10):
+        self.budget = budget
+        self.signatures = signatures
+        self.step = step
+        self.min_timeout = min_timeout
+        self.records: list[dict[str, Any]] = []
+        self.failures: dict[str, str] = dict()
+
+        if telemetry and telemetry.path.exists():
+            self.records = list(Telemetry.read(telemetry.path))
+
+    def features(self, job: SynthesisJob) -> dict[str, int]:
+        """The properties of a job on which its cost depends."""
+        lo, hi = job.solution_length
+        tools = len(self.signatures.relevant(job.inputs, job.outputs, hi)) \
+            if self.signatures else 0
+        return dict(tools=tools, inputs=len(job.inputs),
+            outputs=len(job.outputs), min_length=lo, max_length=hi)
+
+    @staticmethod
+    def complexity(features: dict[str, int]) -> float:
+        """A rough measure of the size of APE's search space, which grows with
+        the number of tools and types at every step and with the number of
+        steps."""
+        return max(1, features['tools']) \
+            * (features['inputs'] + features['outputs']) \
+            * features['max_length'] ** 2
+
+    def predict(self, job: SynthesisJob) -> float:
+        """Expected number of seconds that a job will take. A run of a job 
+        may have left several records, one for every step and engine; those 
+        add up, so the total is divided by the number of runs. Records 
+        without a `run` are taken to be runs of their own."""
+        known = [r for r in self.records if r['name'] == str(job.prefix)]
+        if known:
+            runs = set(r.get('run') or i for i, r in enumerate(known))
+            return sum(r['seconds'] for r in known) / len(runs)
+        cost = self.complexity(self.features(job))
+        if self.records:
+            rate = sum(r['seconds'] for r in self.records) / sum(
+                self.complexity(r) for r in self.records)
+            return rate * cost
+        return cost
+
+    def order(self, jobs: Iterable[SynthesisJob]) \
+            -> list[tuple[SynthesisJob, float]]:
+        """Jobs along with their predicted cost, most expensive first."""
+        return sorted(((job, self.predict(job)) for job in jobs),
+            key=lambda x: x[1], reverse=True)
+
+    def plan(self, jobs: Iterable[SynthesisJob], workers: int = 1) \
+            -> list[SynthesisJob]:
+        """Copies of the jobs, most expensive first, with their timeouts set
+        to their share of the budget. This is for running jobs in parallel
+        (see `SynthesisPool`), with the budget counted per worker."""
+        ordered = self.order(jobs)
+        budget: float
+        if self.budget is None:
+            budget = sum(job.timeout for job, _ in ordered)
+        else:
+            budget = workers * self.budget
+        total = sum(cost for _, cost in ordered) or 1
+        result = []
+        for job, cost in ordered:
+            timeout = int(min(job.timeout,
+                max(self.min_timeout, budget * cost / total)))
+            result.append(SynthesisJob(job.name,
+                **dict(job.kwargs(), timeout=timeout)))
+        return result
+
+    def run(self, synthesizer: Any, jobs: Iterable[SynthesisJob]) \
+            -> Iterator[tuple[SynthesisJob, Graph | None]]:
+        """Run jobs one after another on a `WorkflowGenerator` (or anything
+        with the same `run()` method), in the same manner as
+        `SynthesisPool.run()`. The solution length of every job is deepened
+        by `step` at a time, so that a job stops as soon as it has found
+        enough solutions or used up its share of the budget; all steps are 
+        part of the same `run`. Jobs that are not started because the budget 
+        ran out are recorded in `failures`."""
+
+        ordered = self.order(jobs)
+        budget: float
+        if self.budget is None:
+            budget = sum(job.timeout for job, _ in ordered)
+        else:
+            budget = self.budget
+        deadline = time.monotonic() + budget
+        remaining: float = sum(cost for _, cost in ordered) or 1
+
+        for job, cost in ordered:
+            start = time.monotonic()
+            share = min(job.timeout, deadline - start,
+                max(self.min_timeout, (deadline - start) * cost / remaining))
+            remaining = max(0, remaining - cost) or 1
+            if share < 1:
+                print(f"Out of time for {job}", file=sys.stderr)
+                self.failures[job.name] = "Time budget exhausted"
+                yield job, None
+                continue
+
+            print(f"Scheduling {job} for {int(share)}s", file=sys.stderr)
+            run = job.run or run_id()
+            lo, hi = job.solution_length
+            reached = lo - 1
+            found = 0
+            while found < job.solutions and reached < hi:
+                left = start + share - time.monotonic()
+                if left < 1:
+                    break
+                upto = min(hi, reached + self.step)
+                kwargs = job.kwargs()
+                kwargs.update(solution_length=(reached + 1, upto),
+                    solutions=job.solutions - found, timeout=int(left),
+                    first=job.first + found, run=run)
+                for wf in synthesizer.run(**kwargs):
+                    found += 1
+                    yield job, wf
+                reached = upto
+            yield job, None
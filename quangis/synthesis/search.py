@@ -0,0 +1,330 @@
+"""
+A synthesis engine in pure Python. For short workflows, an exhaustive search
+is faster than starting a JVM and building APE's SAT encoding.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+import typing
+from pathlib import Path
+from itertools import product
+from typing import Any, Iterable, Iterator
+from rdflib import Graph, URIRef
+from transforge.namespace import EX
+
+from quangis.polytype import Polytype
+from quangis.synthesis.ape import _Workflow, Structure
+from quangis.synthesis.signature import ToolSignatures, Extension, uris
+from quangis.synthesis.constraint import Constraint, MODULE_TEMPLATES
+from quangis.synthesis.telemetry import Telemetry, run_id
+
+"""An application of a tool, as the tool along with the indices of its input
+and output resources."""
+App = tuple[str, tuple[int, ...], tuple[int, ...]]
+
+"""A constraint along with its parameters, as sets of tools or extensions."""
+Rule = tuple[str, list]
+
+
+class NativeSynthesis(object):
+    """Searches workflows of increasing length, with the same interface as
+    `APE`.
+
+    Like APE, every resource is eventually assigned a single class in every
+    dimension: every tool that uses it narrows down the classes it could
+    have, and it is only passed to a tool if some class would remain (see
+    `ToolSignatures`). Like APE, the output of every tool must be used, and
+    solutions are found from shortest to longest. Unlike APE, only some
+    constraints are understood, and they may only refer to tools and not to
+    classes of tools; see `supports()`."""
+
+    # Constraints that can be checked once a workflow is complete
+    constraints = {"use_m", "nuse_m", "last_m", "connected_op",
+        "not_connected_op", "not_repeat_op", "use_t", "gen_t", "nuse_t",
+        "ngen_t"}
+
+    # Beyond this, APE is expected to be faster
+    max_length = 3
+
+    def __init__(self, signatures: ToolSignatures,
+            telemetry: Telemetry | None = None):
+        """If `telemetry` is given, a record of every run is written to it, 
+        as for `APE`."""
+        self.signatures = signatures
+        self.telemetry = telemetry
+        self.tools = sorted(signatures.inputs)
+
+    def supports(self, constraints: dict | None) -> bool:
+        """Check whether all constraints are understood. Tool constraints on 
+        classes of tools are not, since the tool taxonomy is unknown here."""
+        for c in (constraints or {}).get('constraints', ()):
+            if c.get('constraintid') not in self.constraints:
+                return False
+            id, params = Constraint.from_json(c)
+            if id in MODULE_TEMPLATES and not all(
+                    str(t) in self.signatures.inputs
+                    for p in params for t in p):
+                return False
+        return True
+
+    def run(self,
+            inputs: Iterable[Polytype],
+            outputs: Iterable[Polytype],
+            prefix: URIRef = EX["solution"],
+            solution_length: tuple[int, int] = (1, 3),
+            solutions: int = 10,
+            timeout: int = 600,
+            use_workflow_input: typing.Literal["NONE", "ONE", "ALL"] = "ALL",
+            constraints: dict | None = None,
+            output_dir: Path = Path("."),
+            first: int = 1,
+            guide: Iterable[Polytype] = (),
+            run: str | None = None) -> Iterator[Graph]:
+        """If a `guide` is given, it is taken to be the chain of types that 
+        a solution should pass through, in order. Only solutions in which 
+        every tool output has one of those types (or that of an output), and 
+        in which every type of the guide occurs, are considered. Since that 
+        cuts the search space down considerably, guided searches are not 
+        limited to `max_length`. Tools are tried in the order of the types in 
+        the chain that they produce. Telemetry records of the same `run` share 
+        its identifier, as in `APE.run()`."""
+
+        if not self.supports(constraints):
+            raise ValueError(
+                "Only the constraints in `NativeSynthesis.constraints` are "
+                "supported, and only on tools")
+
+        # Type parameters are converted to extensions, tool parameters to 
+        # sets of tools
+        rules: list[Rule] = []
+        for c in (constraints or {}).get('constraints', ()):
+            id, params = Constraint.from_json(c)
+            if id in MODULE_TEMPLATES:
+                rules.append((id, [set(str(t) for t in p)  # type: ignore
+                    for p in params]))
+            else:
+                rules.append((id, [self.signatures.extension(
+                    uris(p)) for p in params]))  # type: ignore
+
+        inputs, outputs, guide = list(inputs), list(outputs), list(guide)
+        record: dict[str, Any] = dict(name=str(prefix),
+            run=run or run_id(), engine="native",
+            tools=len(self.tools), inputs=len(inputs), outputs=len(outputs),
+            min_length=solution_length[0], max_length=solution_length[1],
+            timeout=timeout, cached=False, guided=bool(guide))
+        start = time.monotonic()
+        lengths = []
+
+        print("Searching for", prefix, file=sys.stderr)
+        found = self.search(inputs, outputs, solution_length,
+            solutions, timeout, use_workflow_input, rules,
+            [self.signatures.extension(t) for t in guide])
+        for i, structure in enumerate(found):
+            lengths.append(len(structure[2]))
+            yield _Workflow.from_structure(prefix + str(first + i), structure)
+
+        if self.telemetry:
+            seconds = time.monotonic() - start
+            record.update(seconds=seconds, solutions=len(lengths),
+                lengths=lengths, timed_out=seconds >= timeout)
+            self.telemetry.write(record)
+
+    def search(self, inputs: list[Polytype], outputs: list[Polytype],
+            solution_length: tuple[int, int], solutions: int, timeout: float,
+            use_workflow_input: str, rules: list[Rule],
+            guide: list[Extension] = []) -> Iterator[Structure]:
+
+        sig = self.signatures
+        lo, hi = solution_length
+        if hi > self.max_length and not guide:
+            raise ValueError(f"Cannot search beyond {self.max_length} steps")
+
+        deadline = time.monotonic() + timeout
+        sources = [sig.extension(t) for t in inputs]
+        goals = [sig.extension(t) for t in outputs]
+        seen: set[tuple[str, ...]] = set()
+        count = 0
+
+        for n in range(max(lo, 1), hi + 1):
+            relevant = sig.relevant(inputs, outputs, n)
+            bwd = sig.backward(outputs, n)
+            tools = [t for t in self.tools if t in relevant and not any(
+                id == "nuse_m" and t in p[0] for id, p in rules)]
+            if guide:
+                rank = {t: r for t in tools
+                    if (r := self.rank(t, guide + goals)) is not None}
+                tools = sorted(rank, key=rank.__getitem__)
+
+            # Resources and applications are also named after how they were 
+            # derived, which does not depend on the order of the steps
+            def extend(apps: list[App], exts: list[Extension],
+                    names: list[str], app_names: list[str]) \
+                    -> Iterator[tuple[list[App], list[Extension], list[str]]]:
+                step = len(apps) + 1
+                if step > n:
+                    yield apps, exts, app_names
+                    return
+                if time.monotonic() > deadline:
+                    return
+
+                for tool in tools:
+                    if bwd[tool] > n - step + 1:
+                        continue
+                    candidates = [
+                        [r for r, ext in enumerate(exts)
+                            if sig.overlap(ext, i)]
+                        for i in sig.inputs[tool]]
+                    for chosen in product(*candidates):
+                        # Inputs are unordered in the resulting graph
+                        name = f"{tool}(" \
+                            f"{','.join(sorted(names[r] for r in chosen))})"
+
+                        # Independent steps could be taken in any order, so
+                        # only the one in which they are sorted is considered
+                        if apps and name < app_names[-1] and \
+                                not any(r in apps[-1][2] for r in chosen):
+                            continue
+
+                        new = list(exts)
+                        for r, i in zip(chosen, sig.inputs[tool]):
+                            new[r] = narrow(new[r], i)
+                        if not all(all(x) for x in new):
+                            continue
+                        outs = tuple(range(len(new),
+                            len(new) + len(sig.outputs[tool])))
+                        new.extend(sig.outputs[tool])
+                        yield from extend(apps + [(tool, chosen, outs)], new,
+                            names + [f"{name}[{j}]" for j in range(len(outs))],
+                            app_names + [name])
+
+            for apps, exts, app_names in extend([], sources,
+                    [f"#{r}" for r in range(len(sources))], []):
+                result = self.complete(apps, exts, len(sources), goals,
+                    use_workflow_input, rules, guide)
+                if result is None:
+                    continue
+                key = tuple(sorted(app_names))
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield self.structure(apps, result, len(sources))
+                count += 1
+                if count >= solutions:
+                    return
+
+            if time.monotonic() > deadline:
+                print("Search timed out", file=sys.stderr)
+                return
+
+    def complete(self, apps: list[App], exts: list[Extension],
+            nsources: int, goals: list[Extension], use_workflow_input: str,
+            rules: list[Rule], guide: list[Extension] = []) \
+            -> list[Extension] | None:
+        """Check whether a sequence of applications is a solution, and if so,
+        return the resource types once they are narrowed down by the goals."""
+
+        consumed = set(r for _, ins, _ in apps for r in ins)
+        used_sources = sum(1 for r in range(nsources) if r in consumed)
+        if use_workflow_input == "ALL" and used_sources < nsources:
+            return None
+        elif use_workflow_input == "ONE" and used_sources == 0:
+            return None
+
+        # Assign a distinct tool output to every goal
+        produced = [r for _, _, outs in apps for r in outs]
+
+        if not all(self.satisfies(id, params, apps, exts, consumed, produced)
+                for id, params in rules):
+            return None
+
+        if not all(any(ToolSignatures.overlap(exts[r], t) for r in produced)
+                for t in guide):
+            return None
+
+        def assign(i: int, exts: list[Extension], taken: set[int]) \
+                -> list[Extension] | None:
+            if i == len(goals):
+                # The outputs of every tool must be used
+                if all(r in consumed or r in taken for r in produced):
+                    return exts
+                return None
+            for r in produced:
+                if r not in taken and \
+                        ToolSignatures.overlap(exts[r], goals[i]):
+                    new = list(exts)
+                    new[r] = narrow(new[r], goals[i])
+                    result = assign(i + 1, new, taken | {r})
+                    if result is not None:
+                        return result
+            return None
+
+        return assign(0, exts, set())
+
+    def satisfies(self, id: str, params: list, apps: list[App],
+            exts: list[Extension], consumed: set[int],
+            produced: list[int]) -> bool:
+        """Check a constraint on a complete workflow. Resources are taken to 
+        have a type if they could have it; for negative constraints, only if 
+        they must have it."""
+
+        if id in MODULE_TEMPLATES:
+            if id == "use_m":
+                return any(tool in params[0] for tool, _, _ in apps)
+            elif id == "nuse_m":
+                return not any(tool in params[0] for tool, _, _ in apps)
+            elif id == "last_m":
+                return any(tool in params[0] and not any(r in consumed
+                    for r in outs) for tool, _, outs in apps)
+            elif id == "not_repeat_op":
+                used = [tool for tool, _, _ in apps if tool in params[0]]
+                return len(used) == len(set(used))
+            connected = any(a in params[0] and b in params[1]
+                and any(r in ins for r in outs)
+                for a, _, outs in apps for b, ins, _ in apps)
+            return connected == (id == "connected_op")
+
+        t = params[0]
+        if id == "use_t":
+            return any(ToolSignatures.overlap(exts[r], t) for r in consumed)
+        elif id == "gen_t":
+            return any(ToolSignatures.overlap(exts[r], t) for r in produced)
+        elif id == "nuse_t":
+            return not any(within(exts[r], t) for r in consumed)
+        else:
+            assert id == "ngen_t"
+            return not any(within(exts[r], t) for r in produced)
+
+    def rank(self, tool: str, chain: list[Extension]) -> int | None:
+        """The position of the first type in a chain that the tool can 
+        produce, or `None` if it produces none of them."""
+        return min((i for i, t in enumerate(chain)
+            if any(self.signatures.overlap(o, t)
+                for o in self.signatures.outputs[tool])),
+            default=None)
+
+    def structure(self, apps: list[App], exts: list[Extension],
+            nsources: int) -> Structure:
+        resources = [
+            tuple(self.representative(d, x) for d, x in enumerate(ext))
+            for ext in exts]
+        return (resources, list(range(nsources)), [
+            (URIRef(tool), list(ins), list(outs))
+            for tool, ins, outs in apps])
+
+    def representative(self, i: int, classes: frozenset[URIRef]) -> URIRef:
+        """Pick the most general class that a resource can have in a
+        dimension; any class it could have is a subclass of every type it is
+        required to have."""
+        dimension = self.signatures.dimensions[i]
+        return min(c for c in classes
+            if not any(p in classes for p in dimension.parents(c)))
+
+
+def narrow(a: Extension, b: Extension) -> Extension:
+    return tuple(x & y for x, y in zip(a, b))
+
+
+def within(a: Extension, b: Extension) -> bool:
+    return all(x <= y for x, y in zip(a, b))
@@ -0,0 +1,193 @@
+"""
+A long-running synthesis server that keeps a JVM and APE's domain setup warm,
+so that processes which need workflows do not each have to pay for starting
+Java and loading the domain. Requests are accepted over a local Unix socket
+and solutions are streamed back as Turtle.
+
+Start it with `python -m quangis.synthesis.server`.
+"""
+
+from __future__ import annotations
+
+import sys
+import json
+import socket
+import hashlib
+import argparse
+import typing
+import socketserver
+from pathlib import Path
+from typing import Iterable, Iterator, Any
+from platformdirs import user_runtime_dir
+from rdflib import Graph, URIRef
+from rdflib.namespace import RDF
+from transforge.namespace import EX
+
+from quangis.namespace import WF
+from quangis.polytype import Polytype
+from quangis.synthesis.ape import APE, _Workflow
+from quangis.synthesis.cache import SynthesisCache
+from quangis.synthesis.generator import WorkflowGenerator
+from quangis.synthesis.job import SynthesisJob
+from quangis.synthesis.telemetry import Telemetry
+
+SOCKET = Path(user_runtime_dir("quangis", "quangis")) / "ape.sock"
+
+
+def toolset_digest(tools: Iterable[Path], build_dir: Path) -> str:
+    digest = hashlib.sha256()
+    for path in tools:
+        digest.update(str(path).encode("utf-8"))
+        digest.update(path.read_bytes())
+    digest.update(str(build_dir).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SynthesisServer(socketserver.UnixStreamServer):
+    """Handles one request at a time, since there is only one JVM. Every
+    toolset that was asked for is kept in memory, keyed by its hash."""
+
+    def __init__(self, path: Path = SOCKET,
+            jvm_args: Iterable[str] = (),
+            cache: SynthesisCache | None = None,
+            telemetry: Telemetry | None = None):
+        self.jvm_args = list(jvm_args)
+        self.cache = cache
+        self.telemetry = telemetry
+        self.generators: dict[str, WorkflowGenerator] = dict()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        super().__init__(str(path), SynthesisRequestHandler)
+
+    def generator(self, tools: list[Path], build_dir: Path) \
+            -> WorkflowGenerator:
+        key = toolset_digest(tools, build_dir)
+        try:
+            return self.generators[key]
+        except KeyError:
+            print(f"Loading toolset {key[:12]}...", file=sys.stderr)
+            build_dir.mkdir(parents=True, exist_ok=True)
+            gen = self.generators[key] = WorkflowGenerator(*tools,
+                build_dir=build_dir, jvm_args=self.jvm_args,
+                cache=self.cache, telemetry=self.telemetry)
+            return gen
+
+
+class SynthesisRequestHandler(socketserver.StreamRequestHandler):
+    """A request is a single line of JSON with the paths of the tool files,
+    the build directory and the `SynthesisJob`. The response consists of one
+    line of JSON for every solution, followed by a final line that reports
+    success or failure."""
+
+    server: SynthesisServer
+
+    def send(self, **msg: Any) -> None:
+        self.wfile.write(json.dumps(msg).encode("utf-8") + b"\n")
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return  # someone was just checking whether we're available
+        try:
+            request = json.loads(line)
+            gen = self.server.generator(
+                [Path(p) for p in request['tools']],
+                Path(request['build_dir']))
+            job = SynthesisJob.from_json(request['job'])
+            for wf in gen.run(**job.kwargs()):
+                if not isinstance(wf, _Workflow):
+                    raise TypeError(
+                        f"Solution is a {type(wf).__name__}, not a workflow")
+                self.send(root=str(wf.root), turtle=wf.serialize(format="ttl"))
+        except Exception as e:
+            self.send(error=f"{type(e).__name__}: {e}")
+        else:
+            self.send(done=True)
+
+
+class SynthesisClient(object):
+    """A thin client for the synthesis server, which can be used in place of
+    a `WorkflowGenerator`."""
+
+    def __init__(self, *tools: Path, build_dir: Path, path: Path = SOCKET):
+        self.tools = [Path(p).absolute() for p in tools]
+        self.build_dir = Path(build_dir).absolute()
+        self.path = path
+
+    @staticmethod
+    def available(path: Path = SOCKET) -> bool:
+        """Check whether a server is listening on the given socket."""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(path))
+            except OSError:
+                return False
+            return True
+
+    constraint = staticmethod(APE.constraint)
+
+    def run(self,
+            inputs: Iterable[Polytype],
+            outputs: Iterable[Polytype],
+            prefix: URIRef = EX["solution"],
+            solution_length: tuple[int, int] = (1, 10),
+            solutions: int = 10,
+            timeout: int = 600,
+            use_workflow_input: typing.Literal["NONE", "ONE", "ALL"] = "ALL",
+            constraints: dict | None = None,
+            guide: Iterable[Polytype] = (),
+            first: int = 1,
+            run: str | None = None) -> Iterator[Graph]:
+
+        job = SynthesisJob(str(prefix), inputs, outputs, prefix=prefix,
+            solution_length=solution_length, solutions=solutions,
+            timeout=timeout, use_workflow_input=use_workflow_input,
+            constraints=constraints, guide=guide, first=first, run=run)
+        request = dict(
+            tools=[str(p) for p in self.tools],
+            build_dir=str(self.build_dir),
+            job=job.to_json())
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(self.path))
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile('rb') as f:
+                for line in f:
+                    msg = json.loads(line)
+                    if 'error' in msg:
+                        raise RuntimeError(f"Synthesis server: {msg['error']}")
+                    elif msg.get('done'):
+                        return
+                    g = Graph()
+                    g.parse(data=msg['turtle'], format="ttl")
+                    wf = _Workflow(URIRef(msg['root']))
+                    wf += g
+                    if (wf.root, RDF.type, WF.Workflow) not in wf:
+                        raise RuntimeError(f"Synthesis server: solution "
+                            f"{wf.root} is not a workflow")
+                    yield wf
+        raise RuntimeError("Synthesis server closed the connection")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--socket", type=Path, default=SOCKET)
+    parser.add_argument("--cache", type=Path, default=None,
+        help="directory in which to cache synthesis results")
+    parser.add_argument("--telemetry", type=Path, default=None,
+        help="file to which to append a record of every run")
+    parser.add_argument("--jvm-arg", action="append", default=[],
+        dest="jvm_args", help="option for the JVM, e.g. --jvm-arg=-Xmx8g")
+    args = parser.parse_args()
+
+    cache = SynthesisCache(args.cache) if args.cache else None
+    telemetry = Telemetry(args.telemetry) if args.telemetry else None
+    with SynthesisServer(args.socket, args.jvm_args, cache,
+            telemetry) as server:
+        print(f"Listening on {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            args.socket.unlink(missing_ok=True)
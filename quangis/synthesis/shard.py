@@ -0,0 +1,75 @@
+"""
+Splitting batches of synthesis jobs across machines. Every machine runs one
+shard of the jobs into its own directory; the directories are merged once
+all shards are done.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
+
+class Shard(object):
+    """One of `count` parts of a batch. Jobs are assigned to a part by a hash
+    of their name, so every machine agrees on the assignment without any
+    coordination, and the assignment does not depend on the order or number
+    of the jobs."""
+
+    def __init__(self, index: int = 0, count: int = 1):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index} out of {count} does not exist")
+        self.index = index
+        self.count = count
+
+    @staticmethod
+    def parse(spec: str) -> Shard:
+        """Read a shard in the form `i/n`, counting from zero."""
+        try:
+            index, count = spec.split("/")
+            return Shard(int(index), int(count))
+        except ValueError as e:
+            raise ValueError(f"Expected a shard in the form i/n, not "
+                f"'{spec}'") from e
+
+    def __str__(self) -> str:
+        return f"{self.index}-of-{self.count}"
+
+    def __contains__(self, name: str) -> bool:
+        digest = hashlib.sha256(name.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.count == self.index
+
+
+def merge(sources: Iterable[Path], dest: Path,
+        skip: Iterable[str] = ("*.tmp", "*.checkpoint.json")) -> list[Path]:
+    """Assemble the output directories of shards into a single directory.
+    N-Triples files that occur in several shards are concatenated; other
+    files are simply copied. Return the files that were written."""
+
+    skip = list(skip)
+    found: dict[Path, list[Path]] = dict()
+    for source in sources:
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and not any(path.match(p) for p in skip):
+                found.setdefault(path.relative_to(source), []).append(path)
+
+    for relative, paths in found.items():
+        target = dest / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        if target.suffix == ".nt":
+            with open(tmp, 'wb') as f:
+                for path in paths:
+                    with open(path, 'rb') as g:
+                        shutil.copyfileobj(g, f)
+        else:
+            if len(paths) > 1:
+                print(f"Warning: {relative} occurs in several shards; "
+                    f"keeping the last", file=sys.stderr)
+            shutil.copyfile(paths[-1], tmp)
+        os.replace(tmp, target)
+    return [dest / r for r in found]
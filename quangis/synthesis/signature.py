@@ -0,0 +1,195 @@
+"""
+Type-level reasoning about the signatures of tools, as they are presented to
+APE. This is much cheaper than synthesis and can be used to rule out tools
+(or entire specifications) before APE ever sees them.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Iterable, Mapping, TYPE_CHECKING
+
+from rdflib.term import Node, URIRef
+from rdflib.namespace import RDFS
+
+from quangis.ccd import ccd
+from quangis.polytype import Dimension
+
+if TYPE_CHECKING:
+    from quangis.synthesis.ape import ToolsDict
+
+"""The extension of a type: for every dimension, the set of classes that
+could be the actual class of a resource of that type."""
+Extension = tuple[frozenset[URIRef], ...]
+
+"""A type as a mapping from dimensions to classes, like a `Polytype`."""
+Type = Mapping[URIRef, Iterable[URIRef]]
+
+
+class ToolSignatures(object):
+    """The input and output types of every tool in a `ToolsDict`.
+
+    Two types are taken to *overlap* if, in every dimension, they have a
+    common subclass. APE assigns one of the most specific classes to every
+    resource, so a resource of one type can only be passed to a tool that
+    expects the other if the types overlap. The reverse does not hold, which
+    makes the analysis conservative: it may keep tools that are useless, but
+    it never rules out a tool that APE could use."""
+
+    def __init__(self, tools: ToolsDict,
+            dimensions: Iterable[Dimension] = ccd.dimensions):
+        self.dimensions = list(dimensions)
+        self.below: list[dict[URIRef, frozenset[URIRef]]] = [
+            dict() for _ in self.dimensions]
+        self.inputs: dict[str, list[Extension]] = dict()
+        self.outputs: dict[str, list[Extension]] = dict()
+
+        for tool in tools['functions']:
+            id = str(tool['id'])
+            self.inputs[id] = [self.extension(uris(t))
+                for t in tool['inputs']]
+            self.outputs[id] = [self.extension(uris(t))
+                for t in tool['outputs']]
+
+    @staticmethod
+    def from_file(path: Path,
+            dimensions: Iterable[Dimension] = ccd.dimensions) \
+            -> ToolSignatures:
+        with open(path, 'r') as f:
+            return ToolSignatures(json.load(f), dimensions)
+
+    def descendants(self, i: int, node: URIRef) -> frozenset[URIRef]:
+        """All subclasses of a class in the `i`th dimension, including the
+        class itself."""
+        try:
+            return self.below[i][node]
+        except KeyError:
+            graph = self.dimensions[i].graph
+            result = frozenset([node]).union(*(
+                self.descendants(i, child)  # type: ignore
+                for child in graph.subjects(RDFS.subClassOf, node)))
+            self.below[i][node] = result
+            return result
+
+    def extension(self, t: Type) -> Extension:
+        """Dimensions that are absent or empty are unconstrained."""
+        result = []
+        for i, d in enumerate(self.dimensions):
+            classes = list(t.get(d.root) or ()) or [d.root]
+            result.append(frozenset.intersection(
+                *(self.descendants(i, c) for c in classes)))
+        return tuple(result)
+
+    @staticmethod
+    def overlap(a: Extension, b: Extension) -> bool:
+        return all(x & y for x, y in zip(a, b))
+
+    def forward(self, inputs: Iterable[Type],
+            max_length: int) -> dict[str, int]:
+        """For every tool that can be applied to the given inputs, the
+        smallest position at which it can occur in a workflow."""
+        available = [self.extension(t) for t in inputs]
+        depth: dict[str, int] = dict()
+        for n in range(1, max_length + 1):
+            new = [tool for tool, ins in self.inputs.items()
+                if tool not in depth and all(
+                    any(self.overlap(a, i) for a in available) for i in ins)]
+            if not new:
+                break
+            for tool in new:
+                depth[tool] = n
+                available.extend(self.outputs[tool])
+        return depth
+
+    def backward(self, outputs: Iterable[Type],
+            max_length: int) -> dict[str, int]:
+        """For every tool whose output can lead to the given outputs, the
+        smallest number of steps from that tool to the end of a workflow,
+        including the tool itself."""
+        needed = [self.extension(t) for t in outputs]
+        depth: dict[str, int] = dict()
+        for n in range(1, max_length + 1):
+            new = [tool for tool, outs in self.outputs.items()
+                if tool not in depth and any(
+                    self.overlap(o, x) for o in outs for x in needed)]
+            if not new:
+                break
+            needed = []
+            for tool in new:
+                depth[tool] = n
+                needed.extend(self.inputs[tool])
+        return depth
+
+    def relevant(self, inputs: Iterable[Type], outputs: Iterable[Type],
+            max_length: int) -> set[str]:
+        """Find the tools that lie on some path from the inputs to the outputs
+        of at most `max_length` steps. This assumes that the output of every
+        tool in a workflow is used, which is what APE requires by default."""
+        fwd = self.forward(inputs, max_length)
+        bwd = self.backward(outputs, max_length)
+        return set(tool for tool, n in fwd.items()
+            if tool in bwd and n + bwd[tool] - 1 <= max_length)
+
+    def min_length(self, inputs: Iterable[Type], outputs: Iterable[Type],
+            max_length: int, use_workflow_input: str = "ALL") -> int | None:
+        """A lower bound on the length of any workflow from the inputs to the 
+        outputs, or `None` if there can be no such workflow of at most 
+        `max_length` steps.
+
+        An output that overlaps an input might be that input, passed through 
+        unchanged, so it gives no bound of its own. However, the output of 
+        the last tool must be an output of the workflow, so at least one 
+        output is produced by a tool.
+
+        Depending on `use_workflow_input`, as in APE, all or one of the inputs 
+        must also be consumed by a tool. Such a tool is preceded by the tools 
+        that produce its other inputs and followed by the tools that lead 
+        from its output to an output of the workflow, assuming, as in 
+        `relevant()`, that the output of every tool is used."""
+        inputs = list(inputs)
+        outputs = list(outputs)
+        sources = [self.extension(t) for t in inputs]
+        fwd = self.forward(inputs, max_length)
+        bwd = self.backward(outputs, max_length)
+        result = 1
+        produced = []
+        for goal in outputs:
+            ext = self.extension(goal)
+            n = min((n for tool, n in fwd.items()
+                if any(self.overlap(o, ext) for o in self.outputs[tool])),
+                default=None)
+            if n is not None:
+                produced.append(n)
+            if not any(self.overlap(s, ext) for s in sources):
+                if n is None:
+                    return None
+                result = max(result, n)
+        if not produced:
+            return None
+        result = max(result, min(produced))
+
+        # The length of the shortest workflow through every relevant tool
+        through = {tool: n + bwd[tool] - 1 for tool, n in fwd.items()
+            if tool in bwd and n + bwd[tool] - 1 <= max_length}
+        consumed = [min((n for tool, n in through.items()
+            if any(self.overlap(s, i) for i in self.inputs[tool])),
+            default=None) for s in sources]
+        known = [n for n in consumed if n is not None]
+        if use_workflow_input == "ALL":
+            if len(known) < len(consumed):
+                return None
+            result = max([result, *known])
+        elif use_workflow_input == "ONE" and consumed:
+            if not known:
+                return None
+            result = max(result, min(known))
+        return result
+
+
+def uris(t: Mapping[Node, Iterable[Node]] | Mapping[str, Iterable[str]]) \
+        -> Type:
+    """Read a type from tool annotations or constraints in APE's format, in
+    which dimensions and classes may be given as strings."""
+    return {URIRef(str(d)): [URIRef(str(c)) for c in cs]
+        for d, cs in t.items()}
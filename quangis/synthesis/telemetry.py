@@ -0,0 +1,97 @@
+"""
+Telemetry for synthesis runs. Every call to APE or to the native search
+appends a record to a file with one JSON object per line, with the `engine`
+that did the work, the time spent in each phase and statistics about the
+solutions. One synthesis `run` may leave several records, for instance of a
+native search followed by APE, which then share an identifier. Records of
+many runs, possibly from several processes, can then be summarized to find
+the specifications that take up most of the time.
+
+Summarize a telemetry file with `python -m quangis.synthesis.telemetry`.
+"""
+
+from __future__ import annotations
+
+import sys
+import csv
+import json
+import argparse
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+"""Phases of a run, as they are recorded."""
+PHASES = ["setup_seconds", "config_seconds", "synthesis_seconds",
+    "conversion_seconds"]
+
+
+def run_id() -> str:
+    """A fresh identifier for the records of a run."""
+    return uuid.uuid4().hex
+
+
+class Telemetry(object):
+    """Appends records to a JSON lines file. Every record is written with a
+    single call, so that processes can share a file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def write(self, record: dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def read(*paths: Path) -> Iterator[dict[str, Any]]:
+        for path in paths:
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    @staticmethod
+    def summary(records: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Aggregate records per specification, the most expensive first. 
+        Records that share a `run` are counted as a single run."""
+        result: dict[str, dict[str, Any]] = dict()
+        runs: dict[str, set[Any]] = dict()
+        for i, r in enumerate(records):
+            s = result.setdefault(r['name'], dict(name=r['name'], runs=0,
+                native=0, cached=0, timeouts=0, seconds=0.0, solutions=0,
+                max_length=0, **{p: 0.0 for p in PHASES}))
+            runs.setdefault(r['name'], set()).add(r.get('run') or i)
+            s['runs'] = len(runs[r['name']])
+            s['native'] += r.get('engine') == "native"
+            s['cached'] += bool(r.get('cached'))
+            s['timeouts'] += bool(r.get('timed_out'))
+            s['seconds'] += r['seconds']
+            s['solutions'] += r['solutions']
+            s['max_length'] = max([s['max_length'], *r.get('lengths', ())])
+            for p in PHASES:
+                s[p] += r.get(p, 0.0)
+        return sorted(result.values(), key=lambda s: s['seconds'],
+            reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarize synthesis telemetry per specification.")
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("-n", type=int, default=None,
+        help="only show the most expensive specifications")
+    args = parser.parse_args()
+
+    summary = Telemetry.summary(Telemetry.read(*args.files))
+    total = sum(s['seconds'] for s in summary) or 1
+    print(f"{len(summary)} specifications, {total:.1f}s in total",
+        file=sys.stderr)
+
+    fields = ["name", "runs", "native", "cached", "timeouts", "seconds",
+        "share",
+        *PHASES, "solutions", "max_length"]
+    writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+    writer.writeheader()
+    for s in summary[:args.n]:
+        writer.writerow(dict(s, share=round(s['seconds'] / total, 4),
+            **{k: round(s[k], 3) for k in ["seconds", *PHASES]}))
@@ -0,0 +1,19 @@
+"""Helpers shared by the tests of tool signatures and native synthesis."""
+
+from quangis.namespace import EX
+from quangis.polytype import Dimension
+
+
+def dimension():
+    """A dimension with a handful of classes, one of which has subclasses."""
+    return Dimension(EX.T, {
+        EX.T: [EX.A, EX.B, EX.C, EX.D, EX.E],
+        EX.A: [EX.A1, EX.A2]})
+
+
+def tool(id, inputs, output):
+    """A tool in APE's format, taking and producing classes of `dimension()`.
+    """
+    return {'id': id, 'label': str(id), 'taxonomyOperations': [id],
+        'inputs': [{EX.T: [i]} for i in inputs],
+        'outputs': [{EX.T: [output]}]}
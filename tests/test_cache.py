@@ -0,0 +1,46 @@
+import os
+import unittest
+import tempfile
+from pathlib import Path
+
+from quangis.synthesis.cache import SynthesisCache
+
+
+class TestSynthesisCache(unittest.TestCase):
+
+    def test_key_is_order_independent_for_dicts(self):
+        self.assertEqual(
+            SynthesisCache.key({"a": 1, "b": [2]}, (1, 10)),
+            SynthesisCache.key({"b": [2], "a": 1}, [1, 10]))
+        self.assertNotEqual(
+            SynthesisCache.key((1, 10)),
+            SynthesisCache.key((1, 9)))
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = SynthesisCache(Path(d))
+            self.assertIsNone(cache.get("x"))
+            cache.put("x", [("root", "data")])
+            self.assertEqual(cache.get("x"), [("root", "data")])
+            cache.put("y", [])
+            self.assertEqual(cache.get("y"), [])
+
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = SynthesisCache(Path(d), max_size=1 << 20)
+            for i, key in enumerate("abc"):
+                cache.put(key, [("root", "x" * 1000)])
+                os.utime(cache.path(key), (i, i))
+
+            # Using an entry makes it the most recently used one
+            cache.get("a")
+            cache.max_size = 2500
+            cache.evict()
+
+            self.assertIsNotNone(cache.get("a"))
+            self.assertIsNone(cache.get("b"))
+            self.assertIsNotNone(cache.get("c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from quangis.synthesis.checkpoint import Checkpoint
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "checkpoint.json"
+            checkpoint = Checkpoint(path, "a")
+            self.assertFalse(checkpoint.resumed)
+            checkpoint.complete("task1", 2, [Path("x.ttl"), Path("y.ttl")])
+
+            checkpoint = Checkpoint(path, "a")
+            self.assertTrue(checkpoint.resumed)
+            self.assertTrue(checkpoint.done("task1"))
+            self.assertFalse(checkpoint.done("task2"))
+            self.assertEqual(checkpoint.jobs["task1"]["solutions"], 2)
+
+            # Progress for other input does not count
+            checkpoint = Checkpoint(path, "b")
+            self.assertFalse(checkpoint.resumed)
+            self.assertFalse(checkpoint.done("task1"))
+
+    def test_remove(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "checkpoint.json"
+            checkpoint = Checkpoint(path, "a")
+            checkpoint.complete("task1", 1, [Path("x.ttl")])
+            checkpoint.remove()
+            self.assertFalse(path.exists())
+            self.assertFalse(Checkpoint(path, "a").resumed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from quangis.synthesis.constraint import sole_operator
+
+
+class TestInverses(unittest.TestCase):
+
+    def test_sole_operator(self):
+        self.assertEqual(sole_operator("revert (1: Contour)"), "revert")
+        self.assertEqual(sole_operator("invert (1: Field(Nom))"), "invert")
+
+    def test_operator_among_others(self):
+        # Both mention a pair of inverse operators, but do more than that
+        self.assertIsNone(sole_operator(
+            "invert (apply1 classify (1: Field(Itv)))"))
+        self.assertIsNone(sole_operator(
+            "revert (select eq (invert (1: Field(Itv)): Coverages(Nom)) "
+            "(-: Nom))"))
+
+    def test_unparseable(self):
+        self.assertIsNone(sole_operator("revert (2: Contour)"))
+        self.assertIsNone(sole_operator("unknown (1: Contour)"))
+
+
+if __name__ == '__main__':
+    unittest.main()
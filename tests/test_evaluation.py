@@ -0,0 +1,192 @@
+import io
+import csv
+import time
+import unittest
+import tempfile
+import threading
+from pathlib import Path
+from rdflib.compare import isomorphic
+from rdflib import Graph, Literal, BNode
+from rdflib.namespace import RDF
+from transforge.expr import Source, ApplicationError
+
+from quangis.namespace import EX, WF, TOOL
+from quangis.cct import cct
+from quangis.evaluation import ToolContext, InferenceCache, \
+    TransformationCache, read_transformation, graph_variants, variants, \
+    graph_variant, rename, variant_root, query, write_csv_summary
+
+
+def example_workflow() -> tuple[Graph, Graph]:
+    """Tools and a workflow that applies one of them to a source."""
+    tools = Graph()
+    tools.add((EX.tool, cct.namespace.expression, Literal("1: Reg")))
+    wf = Graph()
+    app, source, output = BNode(), BNode(), BNode()
+    wf.add((EX.wf, RDF.type, WF.Workflow))
+    wf.add((EX.wf, WF.source, source))
+    wf.add((EX.wf, WF.edge, app))
+    wf.add((app, WF.applicationOf, EX.tool))
+    wf.add((app, WF.input1, source))
+    wf.add((app, WF.output, output))
+    return tools, wf
+
+
+class TestToolContext(unittest.TestCase):
+
+    def test_expression_lookup(self):
+        tools = Graph()
+        tools.add((EX.tool, cct.namespace.expression, Literal("1")))
+        context = ToolContext(tools)
+        self.assertEqual(context.expressions, {EX.tool: "1"})
+
+        wf = context.workflow()
+        app, output = BNode(), BNode()
+        wf.add((EX.wf, RDF.type, WF.Workflow))
+        wf.add((EX.wf, WF.edge, app))
+        wf.add((app, WF.applicationOf, EX.tool))
+        wf.add((app, WF.output, output))
+        wf.refresh()
+        self.assertEqual(wf.expression(output), "1")
+        self.assertRaises(ValueError, wf.expression, EX.other)
+
+    def test_signature(self):
+        tools = Graph()
+        tools.add((EX.tool, cct.namespace.expression,
+            Literal("apply1 (product (size (pi1 (1: Field(Nom))))) "
+                "(2: R2(Bool, Ratio))")))
+        tools.add((EX.tool, TOOL.input, BNode()))
+        tools.add((EX.tool, TOOL.input, BNode()))
+        context = ToolContext(tools)
+        inputs, output = context.signature(EX.tool)
+        self.assertEqual([str(t) for t in inputs],
+            ["R2(Loc, Nom)", "R2(Bool, Ratio)"])
+        self.assertEqual(str(output), "R2(Bool, Ratio)")
+        self.assertIs(context.parsed(EX.tool), context.parsed(EX.tool))
+
+
+class TestInferenceCache(unittest.TestCase):
+
+    def test_concrete_inputs(self):
+        cache = InferenceCache(cct)
+        for _ in range(2):
+            x = cct.parse("1: R(Obj, Reg)", Source())
+            y = cct.parse("1: Reg", Source())
+            expr = cache.parse("select eq (1) (2)", x, y)
+            self.assertEqual(str(expr.type), "R2(Obj, Reg)")
+            self.assertIs(expr.x, y)
+            self.assertIs(expr.f.x, x)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_fresh_sources(self):
+        cache = InferenceCache(cct)
+        for _ in range(2):
+            x, y = Source(), Source()
+            cache.parse("select eq (1) (2)", x, y)
+            self.assertEqual(str(y.type), "Val")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_shared_source(self):
+        # A fresh source feeds two tool applications, and its type variable 
+        # is already referred to elsewhere; that reference must see the type 
+        # that is inferred, whether or not the inference was cached
+        cache = InferenceCache(cct)
+        for _ in range(2):
+            x, y = Source(), Source()
+            other = Source()
+            other.type.unify(y.type)
+            first = cache.parse("select eq (1) (2)", x, y)
+            second = cache.parse("1: Val; nest 1", y)
+            self.assertEqual(str(other.type.follow()), "Val")
+            self.assertEqual(str(second.type), "R1(Val)")
+            self.assertIs(first.x, y)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_failure(self):
+        cache = InferenceCache(cct)
+        for _ in range(2):
+            x = cct.parse("1: Reg", Source())
+            self.assertRaises(ApplicationError, cache.parse,
+                "select eq (1) (2)", x, x)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_unknown_types_are_not_cached(self):
+        cache = InferenceCache(cct)
+        x = cct.parse("1: R(Obj, _)", Source())
+        cache.parse("1", x)
+        self.assertEqual(cache.uncached, 1)
+
+
+class TestTransformationCache(unittest.TestCase):
+
+    def test_round_trip(self):
+        tools, wf = example_workflow()
+        context = ToolContext(tools)
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "wf.ttl"
+            wf.serialize(path, format="ttl")
+            cache = TransformationCache(Path(d) / "cache")
+            g1 = read_transformation(path, context, cache=cache)
+            g2 = read_transformation(path, context, cache=cache)
+            g3 = read_transformation(path, context, cache=cache,
+                passthrough=False)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(g2.uri, EX.wf)
+            self.assertTrue(isomorphic(g1, g2))
+            self.assertTrue(len(g3))
+
+
+class TestVariants(unittest.TestCase):
+
+    def test_graph_variants(self):
+        names = [name for name, _ in graph_variants()]
+        self.assertEqual(len(names), 4)
+        self.assertEqual(
+            {graph_variant(kwargsg) for _, kwargsg, _ in variants()},
+            set(names))
+
+    def test_rename(self):
+        tools, wf = example_workflow()
+        g = read_transformation(wf, tools)
+
+        uri = variant_root(EX.wf, "pass-opaque")
+        renamed = rename(g, uri)
+        self.assertEqual(renamed.uri, uri)
+        self.assertEqual(len(renamed), len(g))
+        self.assertNotIn(EX.wf, set(renamed.subjects()))
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_concurrent_queries(self):
+        tasks = sorted((Path(__file__).parent.parent / "data" / "tasks")
+            .glob("*.ttl"))[:3]
+
+        # Every query waits until all of them are underway, which can only 
+        # happen if they run at the same time
+        barrier = threading.Barrier(len(tasks), timeout=10)
+
+        class Store(object):
+            def run(self, query):
+                barrier.wait()
+                time.sleep(0.05)
+                return {EX.wf}
+
+        actual, expect, stats = query(tasks, Store(), concurrency=3,
+            by_io=True)
+        self.assertEqual(list(actual), list(stats))
+        for task, s in stats.items():
+            self.assertEqual(actual[task], {EX.wf})
+            self.assertEqual(s['results'], 1)
+            self.assertGreaterEqual(s['seconds'], 0.05)
+            self.assertGreater(s['sparql_size'], 0)
+
+        workflows = {EX.wf}.union(*expect.values())
+        handle = io.StringIO()
+        write_csv_summary(handle, actual, expect, workflows, stats)
+        rows = list(csv.DictReader(io.StringIO(handle.getvalue())))
+        self.assertEqual(rows[0]["Results"], "1")
+
+
+if __name__ == '__main__':
+    unittest.main()
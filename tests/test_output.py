@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+from pathlib import Path
+from rdflib import Graph, Literal
+
+from quangis.namespace import EX
+from quangis.synthesis.output import TripleWriter, write_triples
+
+
+class TestTripleWriter(unittest.TestCase):
+
+    def test_streaming(self):
+        graphs = []
+        for i in range(3):
+            g = Graph()
+            g.add((EX[f"wf{i}"], EX.label, Literal(f"Workflow\n{i}")))
+            graphs.append(g)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "out.nt"
+            self.assertEqual(write_triples(path, graphs), 3)
+            with TripleWriter(path, append=True) as writer:
+                writer.add((EX.wf0, EX.label, Literal("again")))
+
+            result = Graph()
+            result.parse(path, format="nt")
+            self.assertEqual(len(result), 4)
+            self.assertIn((EX.wf1, EX.label, Literal("Workflow\n1")), result)
+
+    def test_interrupted(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = Path(d) / "out.nt"
+            with self.assertRaises(RuntimeError):
+                with TripleWriter(path) as writer:
+                    writer.add((EX.wf, EX.label, Literal("x")))
+                    raise RuntimeError
+            self.assertEqual(list(Path(d).iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
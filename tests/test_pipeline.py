@@ -0,0 +1,74 @@
+import threading
+import unittest
+from rdflib import Graph, URIRef
+from rdflib.namespace import RDF
+
+from quangis.namespace import EX, WF
+from quangis.synthesis.ape import _Workflow
+from quangis.synthesis.job import SynthesisJob
+from quangis.synthesis.pipeline import SynthesisPipeline
+
+
+def process(root, data, job, index):
+    g = Graph()
+    g.parse(data=data, format="nt")
+    assert (URIRef(root), RDF.type, WF.Workflow) in g
+    return job.name, index, root
+
+
+class TestSynthesisPipeline(unittest.TestCase):
+
+    def test_order(self):
+        jobs = [SynthesisJob(name, [], [], solutions=3)
+            for name in ("x", "y")]
+
+        def solutions():
+            for job in jobs:
+                for i in range(3):
+                    wf = _Workflow(EX[f"{job.name}{i}"])
+                    wf.add((wf.root, RDF.type, WF.Workflow))
+                    yield job, wf
+                yield job, None
+
+        pipeline = SynthesisPipeline(process, processes=2, backlog=2)
+        results = [(job.name, result)
+            for job, result in pipeline.run(solutions())]
+        self.assertEqual(results, [
+            ("x", ("x", 0, str(EX.x0))),
+            ("x", ("x", 1, str(EX.x1))),
+            ("x", ("x", 2, str(EX.x2))),
+            ("x", None),
+            ("y", ("y", 0, str(EX.y0))),
+            ("y", ("y", 1, str(EX.y1))),
+            ("y", ("y", 2, str(EX.y2))),
+            ("y", None)])
+
+    def test_stop_early(self):
+        # Synthesis that is still producing solutions is stopped and closed 
+        # when the consumer stops, even if the queue is full
+        closed = threading.Event()
+        job = SynthesisJob("x", [], [], solutions=100)
+
+        def solutions():
+            try:
+                for i in range(100):
+                    wf = _Workflow(EX[f"x{i}"])
+                    wf.add((wf.root, RDF.type, WF.Workflow))
+                    yield job, wf
+            finally:
+                closed.set()
+
+        pipeline = SynthesisPipeline(process, processes=1, backlog=1)
+        results = pipeline.run(solutions())
+        self.assertEqual(next(results)[1], ("x", 0, str(EX.x0)))
+        results.close()
+        self.assertTrue(closed.is_set())
+
+        with self.assertRaises(RuntimeError):
+            for job, result in SynthesisPipeline(process, processes=1,
+                    backlog=1).run(solutions()):
+                raise RuntimeError
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import tempfile
+import unittest
+from pathlib import Path
+from rdflib import Graph
+
+from quangis.namespace import EX
+from quangis.polytype import Polytype, Dimension
+from quangis.synthesis.job import SynthesisJob
+from quangis.synthesis.schedule import SynthesisScheduler
+from quangis.synthesis.telemetry import Telemetry
+
+
+class Synthesizer(object):
+    """Finds a solution of every length from `length` onwards."""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.calls = []
+        self.runs = set()
+
+    def run(self, solution_length, solutions, first, run, **kwargs):
+        self.calls.append(solution_length)
+        self.runs.add(run)
+        lo, hi = solution_length
+        for n in range(max(lo, self.length), hi + 1)[:solutions]:
+            yield Graph()
+
+
+class TestSynthesisScheduler(unittest.TestCase):
+
+    def setUp(self):
+        dim = Dimension(EX.T, {EX.T: [EX.A]})
+        a = Polytype({dim: [EX.A]})
+        self.jobs = [
+            SynthesisJob("short", [a], [a], solution_length=(1, 10),
+                solutions=1),
+            SynthesisJob("long", [a, a], [a], solution_length=(1, 10),
+                solutions=3)]
+
+    def test_history(self):
+        with tempfile.TemporaryDirectory() as d:
+            telemetry = Telemetry(Path(d) / "telemetry.jsonl")
+            telemetry.write(dict(name=str(EX.short), tools=0, inputs=1,
+                outputs=1, min_length=1, max_length=10, seconds=100.0,
+                solutions=1))
+            scheduler = SynthesisScheduler(telemetry=telemetry)
+            self.assertEqual(
+                [job.name for job, _ in scheduler.order(self.jobs)],
+                ["long", "short"])
+
+            # Steps of the same run add up
+            telemetry.write(dict(name=str(EX.long), run="a", tools=0,
+                inputs=2, outputs=1, min_length=1, max_length=2,
+                seconds=30.0, solutions=0))
+            telemetry.write(dict(name=str(EX.long), run="a", tools=0,
+                inputs=2, outputs=1, min_length=3, max_length=4,
+                seconds=10.0, solutions=1))
+            scheduler = SynthesisScheduler(telemetry=telemetry)
+            self.assertEqual(scheduler.predict(self.jobs[1]), 40.0)
+            self.assertEqual(
+                [job.name for job, _ in scheduler.order(self.jobs)],
+                ["short", "long"])
+
+    def test_history_of_engines(self):
+        # A guided native search followed by APE, and a short native search 
+        # followed by APE, make two runs that start at the same length
+        with tempfile.TemporaryDirectory() as d:
+            telemetry = Telemetry(Path(d) / "telemetry.jsonl")
+            for run, engine, lo, hi, seconds in [
+                    ("a", "native", 1, 10, 20.0),
+                    ("a", "ape", 1, 10, 40.0),
+                    ("b", "native", 1, 3, 10.0),
+                    ("b", "ape", 4, 10, 50.0)]:
+                telemetry.write(dict(name=str(EX.long), run=run,
+                    engine=engine, tools=0, inputs=2, outputs=1,
+                    min_length=lo, max_length=hi, seconds=seconds,
+                    solutions=0))
+            scheduler = SynthesisScheduler(telemetry=telemetry)
+            self.assertEqual(scheduler.predict(self.jobs[1]), 60.0)
+
+    def test_deepening(self):
+        synthesizer = Synthesizer(4)
+        scheduler = SynthesisScheduler(step=2)
+        results = list(scheduler.run(synthesizer, self.jobs[1:]))
+        self.assertEqual(synthesizer.calls, [(1, 2), (3, 4), (5, 6)])
+        self.assertEqual(len(synthesizer.runs), 1)
+        self.assertEqual(len([wf for _, wf in results if wf is not None]), 3)
+
+    def test_budget(self):
+        scheduler = SynthesisScheduler(budget=0)
+        results = list(scheduler.run(Synthesizer(1), self.jobs))
+        self.assertEqual(results, [(job, None) for job in reversed(self.jobs)])
+        self.assertEqual(set(scheduler.failures), {"long", "short"})
+
+    def test_plan(self):
+        scheduler = SynthesisScheduler(budget=100, min_timeout=1)
+        jobs = scheduler.plan(self.jobs)
+        self.assertEqual([job.name for job in jobs], ["long", "short"])
+        self.assertEqual(sum(job.timeout for job in jobs), 100)
+        self.assertEqual([job.timeout for job in self.jobs], [600, 600])
+
+
+if __name__ == '__main__':
+    unittest.main()
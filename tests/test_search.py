@@ -0,0 +1,110 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from quangis.namespace import EX, WF
+from quangis.polytype import Polytype
+from quangis.synthesis.signature import ToolSignatures
+from quangis.synthesis.search import NativeSynthesis
+from quangis.synthesis.constraint import Constraint
+from quangis.synthesis.telemetry import Telemetry
+
+from helpers import dimension, tool
+
+
+class TestNativeSynthesis(unittest.TestCase):
+
+    def setUp(self):
+        self.dim = dimension()
+        self.engine = NativeSynthesis(ToolSignatures({'functions': [
+            tool(EX.ab, [EX.A], EX.B),
+            tool(EX.bc, [EX.B], EX.C),
+            tool(EX.a1d, [EX.A1], EX.D),
+            tool(EX.dc, [EX.D], EX.C),
+            tool(EX.bbc, [EX.B, EX.B], EX.C),
+        ]}, [self.dim]))
+
+    def tools(self, wf):
+        return sorted(wf.value(app, WF.applicationOf)
+            for app in wf.objects(wf.root, WF.edge))
+
+    def test_solutions(self):
+        a = Polytype({self.dim: [EX.A]})
+        c = Polytype({self.dim: [EX.C]})
+        self.assertEqual([], list(self.engine.run([a], [c],
+            solution_length=(1, 1))))
+        solutions = list(self.engine.run([a], [c], solution_length=(1, 2)))
+        self.assertEqual(
+            sorted(self.tools(wf) for wf in solutions),
+            [[EX.a1d, EX.dc], [EX.ab, EX.bbc], [EX.ab, EX.bc]])
+
+    def test_resources_are_narrowed(self):
+        a = Polytype({self.dim: [EX.A]})
+        d = Polytype({self.dim: [EX.D]})
+        wf, = self.engine.run([a], [d], solution_length=(1, 3))
+        source = wf.value(wf.root, WF.source)
+        self.assertIn(EX.A1, set(wf.objects(source, None)))
+
+    def test_all_inputs_must_be_used(self):
+        a = Polytype({self.dim: [EX.A]})
+        b = Polytype({self.dim: [EX.B]})
+        c = Polytype({self.dim: [EX.C]})
+        self.assertEqual(
+            [self.tools(wf) for wf in self.engine.run([a, b], [c],
+                solution_length=(1, 2))],
+            [[EX.ab, EX.bbc]])
+
+    def test_guided(self):
+        a = Polytype({self.dim: [EX.A]})
+        c = Polytype({self.dim: [EX.C]})
+        d = Polytype({self.dim: [EX.D]})
+        self.assertEqual(
+            [self.tools(wf) for wf in self.engine.run([a], [c],
+                solution_length=(1, 5), guide=[d])],
+            [[EX.a1d, EX.dc]])
+
+    def test_constraints(self):
+        a = Polytype({self.dim: [EX.A]})
+        c = Polytype({self.dim: [EX.C]})
+
+        def run(*constraints):
+            return sorted(self.tools(wf) for wf in self.engine.run([a], [c],
+                solution_length=(1, 2),
+                constraints=Constraint.all_json(constraints, EX.Tool)))
+
+        self.assertEqual(run(Constraint("nuse_m", EX.bc)),
+            [[EX.a1d, EX.dc], [EX.ab, EX.bbc]])
+        self.assertEqual(run(Constraint("not_connected_op", EX.ab, EX.bbc)),
+            [[EX.a1d, EX.dc], [EX.ab, EX.bc]])
+        self.assertEqual(
+            run(Constraint("gen_t", Polytype({self.dim: [EX.D]}))),
+            [[EX.a1d, EX.dc]])
+        with self.assertRaises(ValueError):
+            run(Constraint("ite_m", EX.ab, EX.bc))
+
+    def test_telemetry(self):
+        a = Polytype({self.dim: [EX.A]})
+        c = Polytype({self.dim: [EX.C]})
+        with tempfile.TemporaryDirectory() as d:
+            self.engine.telemetry = Telemetry(Path(d) / "telemetry.jsonl")
+            list(self.engine.run([a], [c], prefix=EX.wf,
+                solution_length=(1, 2), run="x"))
+            record, = Telemetry.read(self.engine.telemetry.path)
+        self.assertEqual(record['name'], str(EX.wf))
+        self.assertEqual(record['run'], "x")
+        self.assertEqual(record['engine'], "native")
+        self.assertEqual(record['solutions'], 3)
+        self.assertEqual(record['lengths'], [2, 2, 2])
+
+    def test_tool_classes_are_not_supported(self):
+        # Without the tool taxonomy, a class of tools cannot be expanded
+        supported = self.engine.supports(Constraint.all_json([
+            Constraint("nuse_m", EX.bc)], EX.Tool))
+        unsupported = self.engine.supports(Constraint.all_json([
+            Constraint("nuse_m", EX.Tool)], EX.Tool))
+        self.assertTrue(supported)
+        self.assertFalse(unsupported)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from quangis.synthesis.shard import Shard, merge
+
+
+class TestShard(unittest.TestCase):
+
+    def test_partition(self):
+        names = [f"job{i}" for i in range(100)]
+        shards = [Shard.parse(f"{i}/3") for i in range(3)]
+        assigned = [[n for n in names if n in s] for s in shards]
+        self.assertEqual(sorted(sum(assigned, [])), sorted(names))
+        self.assertTrue(all(assigned))
+        self.assertTrue(all(n in Shard() for n in names))
+        self.assertRaises(ValueError, Shard.parse, "3/3")
+        self.assertRaises(ValueError, Shard.parse, "1")
+
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as d:
+            root = Path(d)
+            for i, text in enumerate(["<a> <b> <c> .\n", "<d> <e> <f> .\n"]):
+                shard = root / "shards" / f"{i}-of-2"
+                (shard / "q").mkdir(parents=True)
+                (shard / "q" / "impl.nt").write_text(text)
+                (shard / "q" / f"wf{i}.ttl").write_text(f"# {i}")
+                (shard / "q" / "impl.checkpoint.json").write_text("{}")
+            merge(sorted((root / "shards").iterdir()), root / "build")
+
+            out = root / "build" / "q"
+            self.assertEqual(sorted(p.name for p in out.iterdir()),
+                ["impl.nt", "wf0.ttl", "wf1.ttl"])
+            self.assertEqual((out / "impl.nt").read_text(),
+                "<a> <b> <c> .\n<d> <e> <f> .\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from quangis.namespace import EX
+from quangis.polytype import Polytype
+from quangis.synthesis.signature import ToolSignatures
+
+from helpers import dimension, tool
+
+
+class TestToolSignatures(unittest.TestCase):
+
+    def setUp(self):
+        self.dim = dimension()
+        self.signatures = ToolSignatures({'functions': [
+            tool("ab", [EX.A], EX.B),
+            tool("bc", [EX.B], EX.C),
+            tool("a1d", [EX.A1], EX.D),
+            tool("dc", [EX.D], EX.C),
+            tool("cb", [EX.C], EX.B),
+            tool("a2e", [EX.A2], EX.E),
+        ]}, [self.dim])
+
+    def test_overlap_through_common_subclass(self):
+        s = self.signatures
+        self.assertTrue(s.overlap(s.extension({EX.T: [EX.A]}),
+            s.extension({EX.T: [EX.A1]})))
+        self.assertFalse(s.overlap(s.extension({EX.T: [EX.A1]}),
+            s.extension({EX.T: [EX.A2]})))
+        self.assertTrue(s.overlap(s.extension({EX.T: [EX.A1]}),
+            s.extension({})))
+
+    def test_relevant(self):
+        a = Polytype({self.dim: [EX.A]})
+        c = Polytype({self.dim: [EX.C]})
+        s = self.signatures
+        self.assertEqual(s.relevant([a], [c], 1), set())
+        self.assertEqual(s.relevant([a], [c], 2), {"ab", "bc", "a1d", "dc"})
+        self.assertEqual(s.relevant([a], [c], 4),
+            {"ab", "bc", "a1d", "dc", "cb"})
+
+    def test_min_length(self):
+        a = Polytype({self.dim: [EX.A]})
+        a2 = Polytype({self.dim: [EX.A2]})
+        c = Polytype({self.dim: [EX.C]})
+        d = Polytype({self.dim: [EX.D]})
+        s = self.signatures
+        self.assertEqual(s.min_length([a], [c], 10), 2)
+        self.assertEqual(s.min_length([a], [c, d], 10), 2)
+        self.assertIsNone(s.min_length([a], [c], 1))
+        self.assertIsNone(s.min_length([a2], [d], 10))
+
+    def test_min_length_with_input_like_output(self):
+        # As in the generated specifications, one input is like the output, 
+        # but the output must still be produced by a tool
+        a = Polytype({self.dim: [EX.A]})
+        b = Polytype({self.dim: [EX.B]})
+        c = Polytype({self.dim: [EX.C]})
+        e = Polytype({self.dim: [EX.E]})
+        s = self.signatures
+        self.assertEqual(s.min_length([c, a], [c], 10), 2)
+        self.assertIsNone(s.min_length([e, b], [e], 10))
+        self.assertEqual(s.min_length([c, a], [c, a], 10), 2)
+
+    def test_min_length_with_all_inputs_used(self):
+        # Every input must be consumed by a tool on the way to an output
+        a = Polytype({self.dim: [EX.A]})
+        b = Polytype({self.dim: [EX.B]})
+        c = Polytype({self.dim: [EX.C]})
+        d = Polytype({self.dim: [EX.D]})
+        e = Polytype({self.dim: [EX.E]})
+        s = self.signatures
+        self.assertEqual(s.min_length([d, a], [b], 10), 2)
+        self.assertEqual(s.min_length([d, a], [b], 10, "NONE"), 1)
+        self.assertIsNone(s.min_length([c, e], [c], 10))
+        self.assertEqual(s.min_length([c, e], [c], 10, "ONE"), 2)
+        self.assertIsNone(s.min_length([e], [c], 10, "ONE"))
+
+
+if __name__ == '__main__':
+    unittest.main()
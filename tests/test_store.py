@@ -0,0 +1,151 @@
+import unittest
+import tempfile
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from rdflib import Dataset, Graph, Literal, BNode
+from rdflib.namespace import RDFS
+
+from quangis.namespace import EX
+from quangis.store import GraphUploader, UploadError, StoreManifest, sync
+
+
+def graph(uri, label):
+    g = Graph(identifier=uri)
+    g.add((BNode(), RDFS.label, Literal(label)))
+    g.uri = uri
+    return g
+
+
+class Endpoint(object):
+    """A stand-in for the update endpoint of a store, which applies updates
+    to a dataset and fails whenever it is told to."""
+
+    def __init__(self):
+        self.dataset = Dataset()
+        self.requests = 0
+        self.failures: list[int] = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                endpoint.requests += 1
+                status = endpoint.failures.pop(0) if endpoint.failures \
+                    else 200
+                if status == 200:
+                    endpoint.dataset.update(body.decode("utf-8"))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("localhost", 0), Handler)
+        self.url = f"http://localhost:{self.server.server_port}/update"
+        threading.Thread(target=self.server.serve_forever,
+            daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestGraphUploader(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = Endpoint()
+
+    def tearDown(self):
+        self.endpoint.close()
+
+    def test_batches_replace_graphs(self):
+        uploader = GraphUploader(self.endpoint.url, batch_size=2,
+            connections=2)
+        graphs = [graph(EX[f"wf{i}"], "old") for i in range(5)]
+        self.assertEqual(uploader.upload(graphs), 5)
+        self.assertEqual(self.endpoint.requests, 3)
+
+        self.assertEqual(uploader.upload([graph(EX.wf0, "new")]), 1)
+        labels = set(self.endpoint.dataset.graph(EX.wf0).objects())
+        self.assertEqual(labels, {Literal("new")})
+        self.assertEqual(
+            len(set(self.endpoint.dataset.graph(EX.wf4).objects())), 1)
+
+    def test_retry(self):
+        uploader = GraphUploader(self.endpoint.url, retries=2, backoff=0)
+        self.endpoint.failures = [503, 503]
+        self.assertEqual(uploader.upload([graph(EX.wf, "x")]), 1)
+        self.assertEqual(self.endpoint.requests, 3)
+
+        self.endpoint.failures = [400]
+        self.assertRaises(UploadError, uploader.upload,
+            [graph(EX.wf, "x")])
+
+    def test_endpoint_of_store(self):
+        class Store(object):
+            url_sparql = "http://localhost:3030/cct/query"
+        uploader = GraphUploader.for_store(Store())  # type: ignore
+        self.assertEqual(uploader.url.path, "/cct/update")
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = Endpoint()
+
+    def tearDown(self):
+        self.endpoint.close()
+
+    def test_sync(self):
+        def read(path):
+            return graph(EX[path.stem], path.read_text())
+
+        uploader = GraphUploader(self.endpoint.url)
+        with tempfile.TemporaryDirectory() as d:
+            paths = [Path(d) / f"wf{i}.txt" for i in range(3)]
+            for path in paths:
+                path.write_text("a")
+            manifest = StoreManifest(Path(d) / "manifest.json", "store")
+            self.assertEqual(sync(paths, manifest, uploader, read),
+                (3, 0, 0))
+
+            paths[0].write_text("b")
+            paths[2].unlink()
+            manifest = StoreManifest(Path(d) / "manifest.json", "store")
+            self.assertEqual(sync(paths[:2], manifest, uploader, read),
+                (1, 1, 1))
+
+            dataset = self.endpoint.dataset
+            self.assertEqual(set(dataset.graph(EX.wf0).objects()),
+                {Literal("b")})
+            self.assertEqual(len(dataset.graph(EX.wf2)), 0)
+
+            # Files that are skipped are not read again until they change
+            skipped = Path(d) / "skip.txt"
+            skipped.write_text("a")
+            reads = []
+
+            def read_some(path):
+                reads.append(path)
+                return None if path == skipped else read(path)
+
+            manifest = StoreManifest(Path(d) / "manifest.json", "store")
+            self.assertEqual(sync(paths[:2] + [skipped], manifest, uploader,
+                read_some), (0, 2, 0))
+            manifest = StoreManifest(Path(d) / "manifest.json", "store")
+            self.assertEqual(sync(paths[:2] + [skipped], manifest, uploader,
+                read_some), (0, 3, 0))
+            self.assertEqual(reads, [skipped])
+
+            # Another store starts from scratch
+            manifest = StoreManifest(Path(d) / "manifest.json", "other")
+            self.assertEqual(sync(paths[:2], manifest, uploader, read),
+                (2, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
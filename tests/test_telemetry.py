@@ -0,0 +1,34 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from quangis.synthesis.telemetry import Telemetry
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def test_summary(self):
+        with tempfile.TemporaryDirectory() as d:
+            telemetry = Telemetry(Path(d) / "telemetry.jsonl")
+            telemetry.write(dict(name="a", run="r", seconds=1.0,
+                solutions=2, lengths=[2, 3], synthesis_seconds=0.5))
+            telemetry.write(dict(name="b", seconds=5.0, solutions=0,
+                lengths=[], timed_out=True, synthesis_seconds=4.0))
+            telemetry.write(dict(name="a", seconds=0.1, solutions=2,
+                cached=True))
+            telemetry.write(dict(name="a", run="r", engine="native",
+                seconds=0.2, solutions=1, lengths=[1]))
+            summary = Telemetry.summary(Telemetry.read(telemetry.path))
+
+        self.assertEqual([s['name'] for s in summary], ["b", "a"])
+        b, a = summary
+        self.assertEqual((a['runs'], a['native'], a['cached'], a['solutions']),
+            (2, 1, 1, 5))
+        self.assertEqual(a['max_length'], 3)
+        self.assertEqual(b['timeouts'], 1)
+        self.assertAlmostEqual(a['seconds'], 1.3)
+        self.assertAlmostEqual(b['synthesis_seconds'], 4.0)
+
+
+if __name__ == '__main__':
+    unittest.main()